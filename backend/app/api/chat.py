@@ -1,8 +1,11 @@
 """Chat API endpoint with enhanced RAG"""
 
+import asyncio
+import orjson
 import time
 from fastapi import APIRouter, HTTPException, status
-from typing import List, Dict
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
 from backend.app.models.requests import ChatRequest
 from backend.app.models.responses import (
@@ -12,7 +15,7 @@ from backend.app.models.responses import (
     ErrorResponse
 )
 from backend.app.services.query_processor import get_query_preprocessor
-from backend.app.services.hybrid_search import get_hybrid_search_service, get_reranker
+from backend.app.services.hybrid_search import ScoredChunk, get_hybrid_search_service, get_reranker
 from backend.app.services.memory import get_memory_manager
 from backend.app.services.llm import get_llm_service
 from backend.app.utils.logger import api_logger, log_query_metrics
@@ -21,6 +24,9 @@ from backend.app.core.prompts import NO_RELEVANT_CONTEXT_MESSAGE, CONVERSATIONAL
 
 router = APIRouter()
 
+# In-flight background summaries by session; also keeps the tasks from being garbage collected
+_summarization_tasks: Dict[str, asyncio.Task] = {}
+
 
 def determine_confidence(avg_similarity: float, num_chunks: int) -> ConfidenceLevel:
     if num_chunks == 0 or avg_similarity < settings.similarity_threshold:
@@ -33,6 +39,128 @@ def determine_confidence(avg_similarity: float, num_chunks: int) -> ConfidenceLe
         return ConfidenceLevel.LOW
 
 
+async def retrieve_chunks(session_id: str, query_info: Dict) -> Tuple[List[ScoredChunk], bool, Optional[List[float]]]:
+    """Retrieve context chunks for a preprocessed query, reusing the session cache for meta-queries
+
+    Returns the chunks, whether they came from the session cache, and the query
+    embedding used for retrieval (None when no search ran) so it can be reused.
+    """
+    memory_manager = get_memory_manager()
+    
+    if query_info.get("is_meta_query", False):
+        cached_chunks = await memory_manager.get_cached_chunks(session_id)
+        if cached_chunks:
+            api_logger.info("Meta-query detected - reusing cached chunks from previous turn")
+            return cached_chunks, True, None
+    
+    hybrid_search = get_hybrid_search_service()
+    query_embedding = await hybrid_search.vector_store.embed_async(query_info["processed_query"])
+    
+    api_logger.info("Performing hybrid search")
+    # The Pinecone client is blocking, so the search runs on a worker thread
+    retrieved_chunks = await asyncio.to_thread(
+        hybrid_search.search,
+        query=query_info["processed_query"],
+        intent=query_info["intent"],
+        top_k=settings.top_k_results,
+        query_embedding=query_embedding
+    )
+    
+    if retrieved_chunks:
+        api_logger.info("Applying re-ranking")
+        retrieved_chunks = get_reranker().rerank(
+            chunks=retrieved_chunks,
+            remove_duplicates=True,
+            ensure_diversity=True
+        )
+    
+    return retrieved_chunks, False, query_embedding
+
+
+async def summarize_session(session_id: str, upcoming_turns: int = 0):
+    """Summarize older turns of a session once, even when requested concurrently"""
+    memory_manager = get_memory_manager()
+    
+    # Concurrent callers wait here and then find the summary already set
+    async with memory_manager.get_session_lock(session_id):
+        if await memory_manager.needs_summarization(session_id, upcoming_turns):
+            api_logger.info("Conversation needs summarization")
+            turns_to_summarize = await memory_manager.get_turns_for_summarization(session_id)
+            summary = await get_llm_service().summarize_conversation(turns_to_summarize)
+            await memory_manager.set_summary(session_id, summary)
+
+
+async def schedule_summarization(session_id: str):
+    """Start summarizing in the background when the next user turn will need it"""
+    if session_id in _summarization_tasks:
+        return
+    # Checked after the answer, so look one turn ahead to the next user message
+    if not await get_memory_manager().needs_summarization(session_id, upcoming_turns=1):
+        return
+    
+    task = asyncio.create_task(summarize_session(session_id, upcoming_turns=1))
+    _summarization_tasks[session_id] = task
+    task.add_done_callback(lambda done: _finish_summarization(session_id, done))
+
+
+def _finish_summarization(session_id: str, task: asyncio.Task):
+    _summarization_tasks.pop(session_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        api_logger.warning(f"Background summarization failed: {task.exception()}")
+
+
+async def get_memory_context(session_id: str) -> str:
+    """Get conversation memory for the LLM, waiting for an in-flight summarization"""
+    task = _summarization_tasks.get(session_id)
+    if task is not None:
+        # asyncio.wait neither cancels the shared task nor raises its error;
+        # a failed summary is logged when it finishes and the raw turns are used
+        await asyncio.wait([task])
+    
+    return await get_memory_manager().get_context(session_id)
+
+
+def conversational_response(conversation_type: str) -> str:
+    return CONVERSATIONAL_RESPONSES.get(
+        conversation_type,
+        "Hello! I'm here to help you with MakeMyTrip cab vendor integration. How can I assist you today?"
+    )
+
+
+def stream_event(event_type: str, **payload) -> bytes:
+    """Encode a streaming chat event as one NDJSON line"""
+    return orjson.dumps({"type": event_type, **payload}, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def single_message_stream(
+    session_id: str,
+    message: str,
+    confidence: ConfidenceLevel,
+    avg_similarity: float,
+    latency_ms: float
+) -> StreamingResponse:
+    """Stream a canned answer that needs no retrieval or generation"""
+    events = [
+        stream_event("token", content=message),
+        stream_event(
+            "done",
+            session_id=session_id,
+            sources=[],
+            confidence=confidence.value,
+            metadata=ChatMetadata(
+                retrieved_chunks=0,
+                avg_similarity=avg_similarity,
+                latency_ms=round(latency_ms, 2)
+            ).model_dump()
+        )
+    ]
+    return StreamingResponse(iter(events), media_type="application/x-ndjson")
+
+
+def average_score(chunks: List[ScoredChunk]) -> float:
+    return sum(chunk.hybrid_score for chunk in chunks) / len(chunks)
+
+
 @router.post(
     "/chat",
     response_model=ChatResponse,
@@ -52,18 +180,20 @@ async def chat(request: ChatRequest) -> ChatResponse:
     
     try:
         query_preprocessor = get_query_preprocessor()
-        hybrid_search = get_hybrid_search_service()
-        reranker = get_reranker()
         memory_manager = get_memory_manager()
         llm_service = get_llm_service()
         
-        memory_manager.add_user_message(request.session_id, request.user_query)
-        conversation_history = memory_manager.get_conversation_for_query_rewrite(request.session_id)
+        # One round trip records the message and fetches what preprocessing needs
+        conversation_history, has_cached_chunks = await memory_manager.start_turn(
+            request.session_id,
+            request.user_query
+        )
         
         api_logger.info("Preprocessing query")
         query_info = query_preprocessor.preprocess(
             query=request.user_query,
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            has_cached_context=has_cached_chunks
         )
         
         processed_query = query_info["processed_query"]
@@ -74,11 +204,8 @@ async def chat(request: ChatRequest) -> ChatResponse:
         
         if is_conversational:
             api_logger.info(f"Conversational query detected: {conversation_type}")
-            response_text = CONVERSATIONAL_RESPONSES.get(
-                conversation_type,
-                "Hello! I'm here to help you with MakeMyTrip cab vendor integration. How can I assist you today?"
-            )
-            memory_manager.add_assistant_message(request.session_id, response_text)
+            response_text = conversational_response(conversation_type)
+            await memory_manager.finish_turn(request.session_id, response_text)
             latency = (time.time() - start_time) * 1000
             
             return ChatResponse(
@@ -95,32 +222,11 @@ async def chat(request: ChatRequest) -> ChatResponse:
         
         api_logger.info(f"Query intent: {intent}, is_meta: {is_meta_query}, processed: {processed_query[:100]}")
         
-        retrieved_chunks = []
-        used_cache = False
-        
-        if is_meta_query and memory_manager.has_cached_chunks(request.session_id):
-            api_logger.info("Meta-query detected - reusing cached chunks from previous turn")
-            retrieved_chunks = memory_manager.get_cached_chunks(request.session_id)
-            used_cache = True
-        else:
-            api_logger.info("Performing hybrid search")
-            retrieved_chunks = hybrid_search.search(
-                query=processed_query,
-                intent=intent,
-                top_k=settings.top_k_results
-            )
-            
-            if retrieved_chunks:
-                api_logger.info("Applying re-ranking")
-                retrieved_chunks = reranker.rerank(
-                    chunks=retrieved_chunks,
-                    remove_duplicates=True,
-                    ensure_diversity=True
-                )
+        retrieved_chunks, used_cache, query_embedding = await retrieve_chunks(request.session_id, query_info)
         
         if not retrieved_chunks:
             api_logger.warning("No relevant chunks found after hybrid search and re-ranking")
-            memory_manager.add_assistant_message(request.session_id, NO_RELEVANT_CONTEXT_MESSAGE)
+            await memory_manager.finish_turn(request.session_id, NO_RELEVANT_CONTEXT_MESSAGE)
             latency = (time.time() - start_time) * 1000
             
             log_query_metrics(
@@ -145,29 +251,27 @@ async def chat(request: ChatRequest) -> ChatResponse:
                 )
             )
         
-        avg_similarity = sum(chunk.get('hybrid_score', chunk.get('score', 0)) for chunk in retrieved_chunks) / len(retrieved_chunks)
+        avg_similarity = average_score(retrieved_chunks)
         api_logger.info(f"Retrieved {len(retrieved_chunks)} chunks, avg hybrid score: {avg_similarity:.3f}")
         
-        memory_context = memory_manager.get_context(request.session_id)
-        
-        if memory_manager.needs_summarization(request.session_id):
-            api_logger.info("Conversation needs summarization")
-            turns_to_summarize = memory_manager.get_turns_for_summarization(request.session_id)
-            summary = await llm_service.summarize_conversation(turns_to_summarize)
-            memory_manager.set_summary(request.session_id, summary)
-            memory_context = memory_manager.get_context(request.session_id)
+        memory_context = await get_memory_context(request.session_id)
         
         api_logger.info("Generating answer with LLM")
         answer, sources = await llm_service.generate_answer(
             query=request.user_query,
             context=retrieved_chunks,
-            memory=memory_context
+            memory=memory_context,
+            query_embedding=query_embedding,
+            embedding_query=processed_query
         )
         
-        memory_manager.add_assistant_message(request.session_id, answer)
-        
-        if not used_cache:
-            memory_manager.cache_retrieved_chunks(request.session_id, retrieved_chunks, request.user_query)
+        await memory_manager.finish_turn(
+            request.session_id,
+            answer,
+            chunks=None if used_cache else retrieved_chunks,
+            query=request.user_query
+        )
+        await schedule_summarization(request.session_id)
         
         confidence = determine_confidence(avg_similarity, len(retrieved_chunks))
         latency = (time.time() - start_time) * 1000
@@ -209,6 +313,151 @@ async def chat(request: ChatRequest) -> ChatResponse:
         )
 
 
+@router.post(
+    "/chat/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Chat with the travel assist bot (streaming)",
+    description=(
+        "Same pipeline as /chat, but the answer is streamed as newline-delimited JSON events: "
+        "'token' events carry answer text as it is generated, and a final 'done' event carries "
+        "sources, confidence and metadata."
+    ),
+    responses={
+        200: {"description": "NDJSON stream of answer events", "content": {"application/x-ndjson": {}}},
+        400: {"description": "Invalid request", "model": ErrorResponse},
+        500: {"description": "Internal server error", "model": ErrorResponse}
+    }
+)
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """Process a chat query and stream the answer tokens"""
+    api_logger.info(f"Streaming chat request: session={request.session_id}, query={request.user_query[:100]}")
+    start_time = time.time()
+    
+    try:
+        query_preprocessor = get_query_preprocessor()
+        memory_manager = get_memory_manager()
+        llm_service = get_llm_service()
+        
+        # One round trip records the message and fetches what preprocessing needs
+        conversation_history, has_cached_chunks = await memory_manager.start_turn(
+            request.session_id,
+            request.user_query
+        )
+        
+        query_info = query_preprocessor.preprocess(
+            query=request.user_query,
+            conversation_history=conversation_history,
+            has_cached_context=has_cached_chunks
+        )
+        
+        if query_info.get("is_conversational", False):
+            response_text = conversational_response(query_info.get("conversation_type"))
+            await memory_manager.finish_turn(request.session_id, response_text)
+            latency = (time.time() - start_time) * 1000
+            
+            return single_message_stream(
+                request.session_id,
+                response_text,
+                ConfidenceLevel.HIGH,
+                avg_similarity=1.0,
+                latency_ms=latency
+            )
+        
+        retrieved_chunks, used_cache, query_embedding = await retrieve_chunks(request.session_id, query_info)
+        
+        if not retrieved_chunks:
+            api_logger.warning("No relevant chunks found after hybrid search and re-ranking")
+            await memory_manager.finish_turn(request.session_id, NO_RELEVANT_CONTEXT_MESSAGE)
+            latency = (time.time() - start_time) * 1000
+            
+            log_query_metrics(
+                api_logger,
+                session_id=request.session_id,
+                query=request.user_query,
+                retrieved_chunks=0,
+                avg_similarity=0.0,
+                latency_ms=latency,
+                confidence="none"
+            )
+            
+            return single_message_stream(
+                request.session_id,
+                NO_RELEVANT_CONTEXT_MESSAGE,
+                ConfidenceLevel.NONE,
+                avg_similarity=0.0,
+                latency_ms=latency
+            )
+        
+        avg_similarity = average_score(retrieved_chunks)
+        memory_context = await get_memory_context(request.session_id)
+        
+    except ValueError as e:
+        api_logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    except Exception as e:
+        api_logger.error(f"Error processing streaming chat request: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing request: {str(e)}"
+        )
+    
+    async def answer_events() -> AsyncIterator[bytes]:
+        parts = []
+        try:
+            async for delta in llm_service.stream_answer(
+                query=request.user_query,
+                context=retrieved_chunks,
+                memory=memory_context,
+                query_embedding=query_embedding,
+                embedding_query=query_info["processed_query"]
+            ):
+                parts.append(delta)
+                yield stream_event("token", content=delta)
+        except Exception as e:
+            api_logger.error(f"Error streaming answer: {str(e)}", exc_info=True)
+            yield stream_event("error", message=f"Error processing request: {str(e)}")
+            return
+        
+        await memory_manager.finish_turn(
+            request.session_id,
+            "".join(parts),
+            chunks=None if used_cache else retrieved_chunks,
+            query=request.user_query
+        )
+        await schedule_summarization(request.session_id)
+        
+        confidence = determine_confidence(avg_similarity, len(retrieved_chunks))
+        latency = (time.time() - start_time) * 1000
+        
+        log_query_metrics(
+            api_logger,
+            session_id=request.session_id,
+            query=request.user_query,
+            retrieved_chunks=len(retrieved_chunks),
+            avg_similarity=avg_similarity,
+            latency_ms=latency,
+            confidence=confidence.value
+        )
+        
+        yield stream_event(
+            "done",
+            session_id=request.session_id,
+            sources=llm_service.get_sources(retrieved_chunks),
+            confidence=confidence.value,
+            metadata=ChatMetadata(
+                retrieved_chunks=len(retrieved_chunks),
+                avg_similarity=round(avg_similarity, 3),
+                latency_ms=round(latency, 2)
+            ).model_dump()
+        )
+    
+    return StreamingResponse(answer_events(), media_type="application/x-ndjson")
+
+
 @router.get(
     "/session/{session_id}",
     summary="Get session information",
@@ -217,7 +466,7 @@ async def chat(request: ChatRequest) -> ChatResponse:
 async def get_session_info(session_id: str):
     try:
         memory_manager = get_memory_manager()
-        stats = memory_manager.get_session_stats(session_id)
+        stats = await memory_manager.get_session_stats(session_id)
         return {
             "session_id": session_id,
             **stats
@@ -238,7 +487,7 @@ async def get_session_info(session_id: str):
 async def clear_session(session_id: str):
     try:
         memory_manager = get_memory_manager()
-        success = memory_manager.clear_session(session_id)
+        success = await memory_manager.clear_session(session_id)
         if success:
             return {"status": "success", "message": f"Session {session_id} cleared"}
         else:
@@ -1,5 +1,6 @@
 """Document ingestion API endpoint"""
 
+import asyncio
 import time
 from fastapi import APIRouter, HTTPException, status
 from typing import Optional
@@ -32,13 +33,15 @@ async def ingest_documentation(request: IngestRequest = IngestRequest()):
     
     try:
         vector_store = get_vector_store()
+        # Bootstrapping may create the index and poll until it is ready, so it stays off the event loop
+        await asyncio.to_thread(vector_store.bootstrap_index)
         
         if request.force_reindex:
             api_logger.info("Force reindex requested, clearing existing vectors")
-            vector_store.delete_all()
-            time.sleep(2)
+            await asyncio.to_thread(vector_store.delete_all)
+            await asyncio.sleep(2)
         else:
-            stats = vector_store.get_stats()
+            stats = await asyncio.to_thread(vector_store.get_stats)
             if stats.get('total_vectors', 0) > 0:
                 api_logger.warning("Index already contains vectors. Use force_reindex=true to re-ingest")
                 return IngestResponse(
@@ -60,7 +63,7 @@ async def ingest_documentation(request: IngestRequest = IngestRequest()):
         api_logger.info(f"Created {len(chunks)} chunks")
         
         api_logger.info("Uploading chunks to vector store")
-        upsert_result = vector_store.upsert_chunks(chunks)
+        upsert_result = await asyncio.to_thread(vector_store.upsert_chunks, chunks)
         
         total_time = time.time() - start_time
         
@@ -118,7 +121,7 @@ async def ingest_documentation(request: IngestRequest = IngestRequest()):
 async def get_ingestion_status():
     try:
         vector_store = get_vector_store()
-        stats = vector_store.get_stats()
+        stats = await asyncio.to_thread(vector_store.get_stats)
         return {
             "status": "ok",
             "vector_store": stats
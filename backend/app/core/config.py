@@ -15,9 +15,13 @@ class Settings(BaseSettings):
     pinecone_api_key: str
     pinecone_environment: str = "us-east-1"
     pinecone_index_name: str = "mmt-cab-docs"
+    pinecone_upsert_workers: int = 4
+    pinecone_assume_ready: bool = False
     
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
     embedding_dimension: int = 384
+    embedding_batch_max_size: int = 32
+    embedding_batch_wait_ms: float = 10.0
     
     chunk_size: int = 500
     chunk_overlap: int = 100
@@ -25,9 +29,28 @@ class Settings(BaseSettings):
     similarity_threshold: float = 0.30
     
     max_conversation_turns: int = 6
+    max_session_turns: int = 24
+    
+    redis_url: Optional[str] = None
+    session_ttl_hours: int = 24
+    chunk_cache_ttl_seconds: int = 600
     
     llm_temperature: float = 0.05
     llm_max_tokens: int = 1200
+    llm_max_connections: int = 200
+    llm_max_keepalive_connections: int = 100
+    llm_timeout_seconds: float = 60.0
+    llm_connect_timeout_seconds: float = 5.0
+    llm_max_attempts: int = 3
+    
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.90
+    semantic_cache_ttl_seconds: int = 300
+    semantic_cache_max_size: int = 512
+    
+    response_cache_enabled: bool = True
+    response_cache_ttl_seconds: int = 300
+    response_cache_max_size: int = 256
     
     log_level: str = "INFO"
     documentation_path: str = "documentation.txt"
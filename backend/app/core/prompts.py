@@ -1,5 +1,8 @@
 """System prompts for the chatbot"""
 
+import re
+from typing import List
+
 CONVERSATIONAL_RESPONSES = {
     "greeting": "Hello! I'm your MakeMyTrip cab vendor integration assistant. I'm here to help you understand and integrate with the MMT cab booking platform. Feel free to ask me anything about the APIs, workflows, or integration process.",
     "gratitude": "You're welcome! I'm happy to help with your MMT integration. If you have any more questions about the APIs or documentation, feel free to ask.",
@@ -144,3 +147,22 @@ AMBIGUOUS_QUERY_TEMPLATE = """Your question could refer to multiple aspects of t
 {options}
 
 This will help me provide you with the most accurate and relevant information from the documentation."""
+
+
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+
+def split_prompt(template: str) -> List[str]:
+    """Split a template once into literal text at even indexes and placeholder names at odd indexes"""
+    return PLACEHOLDER_PATTERN.split(template)
+
+
+def render_prompt(fragments: List[str], **values: str) -> str:
+    """Fill a split template without re-parsing it, equivalent to template.format(**values)"""
+    parts = fragments.copy()
+    parts[1::2] = [values[name] for name in fragments[1::2]]
+    return "".join(parts)
+
+
+SYSTEM_PROMPT_FRAGMENTS = split_prompt(SYSTEM_PROMPT)
+SUMMARIZATION_PROMPT_FRAGMENTS = split_prompt(SUMMARIZATION_PROMPT)
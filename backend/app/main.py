@@ -1,5 +1,6 @@
 """FastAPI application entry point"""
 
+import asyncio
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -30,6 +31,18 @@ async def lifespan(app: FastAPI):
     yield
     
     app_logger.info("Shutting down Travel Assist Chatbot API")
+    
+    try:
+        from backend.app.services.llm import close_llm_service
+        await close_llm_service()
+    except Exception as e:
+        app_logger.error(f"Error closing LLM client: {str(e)}")
+    
+    try:
+        from backend.app.services.memory import close_memory_manager
+        await close_memory_manager()
+    except Exception as e:
+        app_logger.error(f"Error closing memory store: {str(e)}")
 
 
 app = FastAPI(
@@ -124,7 +137,7 @@ async def health_check():
     try:
         from backend.app.services.vector_store import get_vector_store
         vector_store = get_vector_store()
-        stats = vector_store.get_stats()
+        stats = await asyncio.to_thread(vector_store.get_stats)
         services["vector_store"] = f"ok (vectors: {stats.get('total_vectors', 0)})"
     except Exception as e:
         services["vector_store"] = f"error: {str(e)}"
@@ -160,6 +173,7 @@ async def root():
             "docs": "/docs",
             "health": "/health",
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "ingest": "/ingest"
         }
     }
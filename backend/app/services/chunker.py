@@ -10,6 +10,10 @@ from backend.app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+HEADER_PATTERN = re.compile(r'^#{1,4}\s+')
+H2_ENDPOINT_PATTERN = re.compile(r'\[(/[^\]]+)\]')
+LINK_TARGET_PATTERN = re.compile(r'\[([^\]]+)\]')
+
 
 class DocumentChunker:
     """Intelligent semantic document chunker"""
@@ -29,16 +33,14 @@ class DocumentChunker:
             r'^###\s+',
             r'^####\s+',
         ]
+        # The four markers combined, so a boundary check is one match
+        self._section_marker_re = re.compile('|'.join(self.section_markers))
         
     def count_tokens(self, text: str) -> int:
         return len(self.tokenizer.encode(text))
     
     def _is_section_boundary(self, line: str) -> bool:
-        line_stripped = line.strip()
-        for marker in self.section_markers:
-            if re.match(marker, line_stripped):
-                return True
-        return False
+        return self._section_marker_re.match(line.strip()) is not None
     
     def _extract_section_hierarchy(self, lines: List[str], current_idx: int) -> Dict[str, str]:
         h1_title = "General Documentation"
@@ -54,7 +56,7 @@ class DocumentChunker:
             
             elif line.startswith("## ") and not h2_title:
                 h2_title = line.lstrip("## ").strip()
-                endpoint_match = re.search(r'\[(/[^\]]+)\]', h2_title)
+                endpoint_match = H2_ENDPOINT_PATTERN.search(h2_title)
                 if endpoint_match:
                     api_endpoint = endpoint_match.group(1)
             
@@ -62,7 +64,7 @@ class DocumentChunker:
                 h3_title = line.lstrip("### ").strip()
             
             elif line.startswith("+ [") and not api_endpoint:
-                endpoint_match = re.search(r'\[([^\]]+)\]', line)
+                endpoint_match = LINK_TARGET_PATTERN.search(line)
                 if endpoint_match:
                     potential_endpoint = endpoint_match.group(1)
                     if potential_endpoint.startswith("/") or potential_endpoint.startswith("reference/"):
@@ -90,7 +92,7 @@ class DocumentChunker:
         if not endpoint:
             return ""
         
-        endpoint = re.sub(r'^reference/', '', endpoint)
+        endpoint = endpoint.removeprefix('reference/')
         endpoint = endpoint.strip().lower()
         
         return endpoint
@@ -154,7 +156,7 @@ class DocumentChunker:
         header_positions = []
         for i, line in enumerate(lines):
             stripped = line.strip()
-            if re.match(r'^#{1,4}\s+', stripped):
+            if HEADER_PATTERN.match(stripped):
                 header_positions.append(i)
         
         logger.info(f"Found {len(header_positions)} headers in document")
@@ -231,7 +233,7 @@ class DocumentChunker:
         
         header_lines = []
         for line in lines[:5]:
-            if re.match(r'^#{1,4}\s+', line.strip()) or line.strip().startswith('##'):
+            if HEADER_PATTERN.match(line.strip()) or line.strip().startswith('##'):
                 header_lines.append(line)
         
         if header_lines:
@@ -276,18 +278,16 @@ class DocumentChunker:
         return chunks
     
     def _get_overlap_lines(self, lines: List[str]) -> List[str]:
-        overlap_text = '\n'.join(lines)
-        overlap_tokens = self.count_tokens(overlap_text)
-        
         result = []
         tokens = 0
         for line in reversed(lines):
             line_tokens = self.count_tokens(line)
             if tokens + line_tokens > self.chunk_overlap:
                 break
-            result.insert(0, line)
+            result.append(line)
             tokens += line_tokens
         
+        result.reverse()
         return result
 
 
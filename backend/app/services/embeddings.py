@@ -1,6 +1,8 @@
 """Embedding service using Sentence Transformers"""
 
-from typing import List, Union
+from typing import List, Tuple, Union
+import asyncio
+import threading
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
@@ -71,12 +73,16 @@ class EmbeddingService:
                 show_progress_bar=len(valid_texts) > 50
             )
             
-            result = [[0.0] * settings.embedding_dimension] * len(texts)
+            # Convert the float32 matrix in one call rather than row by row
+            vectors = embeddings.tolist()
+            logger.info(f"Successfully generated {len(valid_texts)} embeddings")
             
-            for idx, embedding in zip(valid_indices, embeddings):
-                result[idx] = embedding.tolist()
+            if len(vectors) == len(texts):
+                return vectors
             
-            logger.info(f"Successfully generated {len(valid_texts)} embeddings")
+            result = [[0.0] * settings.embedding_dimension] * len(texts)
+            for idx, vector in zip(valid_indices, vectors):
+                result[idx] = vector
             return result
             
         except Exception as e:
@@ -109,11 +115,84 @@ class EmbeddingService:
         return settings.embedding_dimension
 
 
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding requests into batched encode calls
+    
+    Requests arriving within a short window (or until the batch is full) share one
+    embed_batch call, which runs in a worker thread so the event loop stays free.
+    """
+    
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        max_batch_size: int = None,
+        max_wait_seconds: float = None
+    ):
+        self.embedding_service = embedding_service
+        self.max_batch_size = max_batch_size or settings.embedding_batch_max_size
+        self.max_wait_seconds = max_wait_seconds or settings.embedding_batch_wait_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        self._tasks = set()
+    
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_seconds, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await asyncio.to_thread(self.embedding_service.embed_batch, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
 _embedding_service = None
+_embedding_batcher = None
+_singleton_lock = threading.Lock()
 
 
 def get_embedding_service() -> EmbeddingService:
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        with _singleton_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
     return _embedding_service
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        # Resolved before taking the lock, which get_embedding_service also takes
+        embedding_service = get_embedding_service()
+        with _singleton_lock:
+            if _embedding_batcher is None:
+                _embedding_batcher = EmbeddingBatcher(embedding_service)
+    return _embedding_batcher
@@ -1,15 +1,61 @@
 """Hybrid search and re-ranking service"""
 
+import heapq
 import re
-from typing import List, Dict, Optional, Set
+import threading
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import List, Dict, Optional, Set, Tuple
 from collections import Counter
 
-from backend.app.services.vector_store import get_vector_store
+from backend.app.services.vector_store import SearchMatch, get_vector_store
 from backend.app.core.config import settings
 from backend.app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+STOP_WORDS = frozenset({
+    'the', 'is', 'at', 'which', 'on', 'a', 'an', 'and', 'or', 'but',
+    'in', 'with', 'to', 'for', 'of', 'as', 'by', 'from', 'can', 'i',
+    'what', 'how', 'do', 'does', 'when', 'where', 'why', 'should'
+})
+
+# (query term, section title terms) pairs that earn a topical metadata boost
+TOPIC_SECTION_TERMS = (
+    ('booking', ('booking',)),
+    ('flow', ('flow', 'flowchart')),
+    ('authentication', ('auth',)),
+    ('payment', ('payment',)),
+    ('tracking', ('tracking',)),
+)
+
+INTENT_SECTION_TERMS = {
+    'flow': ('flow', 'flowchart', 'booking'),
+    'example': ('example',),
+    'api_details': ('api', 'endpoint'),
+}
+
+DEFAULT_SCORE_WEIGHTS = {
+    'semantic': 0.5,
+    'keyword': 0.3,
+    'metadata': 0.2
+}
+
+
+@dataclass(slots=True)
+class ScoredChunk:
+    """Retrieved chunk with its hybrid ranking signals"""
+    
+    id: str
+    text: str
+    metadata: Dict
+    semantic_score: float
+    hybrid_score: float
+    keyword_score: float
+    metadata_score: float
+
 
 class HybridSearchService:
     """Combines semantic search with keyword matching and metadata filtering"""
@@ -18,14 +64,8 @@ class HybridSearchService:
         self.vector_store = get_vector_store()
     
     def _extract_keywords(self, query: str) -> Set[str]:
-        stop_words = {
-            'the', 'is', 'at', 'which', 'on', 'a', 'an', 'and', 'or', 'but',
-            'in', 'with', 'to', 'for', 'of', 'as', 'by', 'from', 'can', 'i',
-            'what', 'how', 'do', 'does', 'when', 'where', 'why', 'should'
-        }
-        
-        words = re.findall(r'\b\w+\b', query.lower())
-        keywords = {w for w in words if w not in stop_words and len(w) > 2}
+        words = WORD_PATTERN.findall(query.lower())
+        keywords = {w for w in words if w not in STOP_WORDS and len(w) > 2}
         
         return keywords
     
@@ -34,7 +74,7 @@ class HybridSearchService:
             return 0.0
         
         text_lower = text.lower()
-        text_words = set(re.findall(r'\b\w+\b', text_lower))
+        text_words = set(WORD_PATTERN.findall(text_lower))
         
         matches = keywords.intersection(text_words)
         match_ratio = len(matches) / len(keywords)
@@ -48,14 +88,21 @@ class HybridSearchService:
         total_score = min(match_ratio + proximity_bonus, 1.0)
         return total_score
     
+    def _query_topic_terms(self, query_lower: str) -> List[Tuple[str, ...]]:
+        return [
+            section_terms
+            for query_term, section_terms in TOPIC_SECTION_TERMS
+            if query_term in query_lower
+        ]
+    
     def _metadata_relevance_score(
         self,
         chunk_metadata: Dict,
-        query: str,
+        query_lower: str,
+        topic_terms: List[Tuple[str, ...]],
         intent: str
     ) -> float:
         score = 0.0
-        query_lower = query.lower()
         
         api_endpoint = chunk_metadata.get('api_endpoint', '')
         if api_endpoint and api_endpoint.lower() in query_lower:
@@ -63,26 +110,49 @@ class HybridSearchService:
         
         section_title = chunk_metadata.get('section_title', '').lower()
         
-        if 'booking' in query_lower and 'booking' in section_title:
-            score += 0.2
-        if 'flow' in query_lower and ('flow' in section_title or 'flowchart' in section_title):
-            score += 0.2
-        if 'authentication' in query_lower and 'auth' in section_title:
-            score += 0.2
-        if 'payment' in query_lower and 'payment' in section_title:
-            score += 0.2
-        if 'tracking' in query_lower and 'tracking' in section_title:
-            score += 0.2
-        
-        if intent == "flow" and any(term in section_title for term in ['flow', 'flowchart', 'booking']):
-            score += 0.15
-        elif intent == "example" and 'example' in section_title:
-            score += 0.15
-        elif intent == "api_details" and any(term in section_title for term in ['api', 'endpoint']):
+        for section_terms in topic_terms:
+            if any(term in section_title for term in section_terms):
+                score += 0.2
+        
+        intent_terms = INTENT_SECTION_TERMS.get(intent)
+        if intent_terms and any(term in section_title for term in intent_terms):
             score += 0.15
         
         return min(score, 1.0)
     
+    def _score_candidate(
+        self,
+        result: SearchMatch,
+        keywords: Set[str],
+        query_lower: str,
+        topic_terms: List[Tuple[str, ...]],
+        intent: str
+    ) -> ScoredChunk:
+        semantic_score = result.score
+        
+        keyword_score = self._keyword_match_score(result.text, keywords)
+        metadata_score = self._metadata_relevance_score(
+            result.metadata,
+            query_lower,
+            topic_terms,
+            intent
+        )
+        hybrid_score = self._calculate_hybrid_score(
+            semantic_score,
+            keyword_score,
+            metadata_score
+        )
+        
+        return ScoredChunk(
+            id=result.id,
+            text=result.text,
+            metadata=result.metadata,
+            semantic_score=semantic_score,
+            hybrid_score=hybrid_score,
+            keyword_score=keyword_score,
+            metadata_score=metadata_score
+        )
+    
     def _calculate_hybrid_score(
         self,
         semantic_score: float,
@@ -91,11 +161,7 @@ class HybridSearchService:
         weights: Dict[str, float] = None
     ) -> float:
         if weights is None:
-            weights = {
-                'semantic': 0.5,
-                'keyword': 0.3,
-                'metadata': 0.2
-            }
+            weights = DEFAULT_SCORE_WEIGHTS
         
         hybrid_score = (
             semantic_score * weights['semantic'] +
@@ -110,18 +176,22 @@ class HybridSearchService:
         query: str,
         intent: str = "general",
         top_k: int = None,
-        metadata_filter: Optional[Dict] = None
-    ) -> List[Dict]:
+        metadata_filter: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[ScoredChunk]:
         """Perform hybrid search combining semantic, keyword, and metadata signals"""
         if top_k is None:
             top_k = settings.top_k_results
         
+        if query_embedding is None:
+            query_embedding = self.vector_store.embed(query)
+        
         keywords = self._extract_keywords(query)
         logger.info(f"Extracted keywords: {keywords}")
         
         retrieve_k = min(top_k * 3, 20)
-        semantic_results = self.vector_store.semantic_search(
-            query=query,
+        semantic_results = self.vector_store.semantic_search_by_vector(
+            query_embedding,
             top_k=retrieve_k,
             filter_dict=metadata_filter
         )
@@ -132,34 +202,18 @@ class HybridSearchService:
         
         logger.info(f"Retrieved {len(semantic_results)} candidates from semantic search")
         
-        ranked_results = []
+        query_lower = query.lower()
+        topic_terms = self._query_topic_terms(query_lower)
         
-        for result in semantic_results:
-            semantic_score = result['score']
-            text = result['text']
-            metadata = result['metadata']
-            
-            keyword_score = self._keyword_match_score(text, keywords)
-            metadata_score = self._metadata_relevance_score(metadata, query, intent)
-            hybrid_score = self._calculate_hybrid_score(
-                semantic_score,
-                keyword_score,
-                metadata_score
-            )
-            
-            ranked_results.append({
-                **result,
-                'hybrid_score': hybrid_score,
-                'keyword_score': keyword_score,
-                'metadata_score': metadata_score,
-                'original_semantic_score': semantic_score
-            })
+        ranked_results = [
+            self._score_candidate(result, keywords, query_lower, topic_terms, intent)
+            for result in semantic_results
+        ]
         
-        ranked_results.sort(key=lambda x: x['hybrid_score'], reverse=True)
-        final_results = ranked_results[:top_k]
+        final_results = heapq.nlargest(top_k, ranked_results, key=attrgetter('hybrid_score'))
         
         if final_results:
-            avg_hybrid = sum(r['hybrid_score'] for r in final_results) / len(final_results)
+            avg_hybrid = sum(r.hybrid_score for r in final_results) / len(final_results)
             logger.info(
                 f"Hybrid search complete: {len(final_results)} results, "
                 f"avg_hybrid_score={avg_hybrid:.3f}"
@@ -174,52 +228,50 @@ class ReRanker:
     def __init__(self):
         pass
     
-    def deduplicate_chunks(self, chunks: List[Dict], similarity_threshold: float = 0.85) -> List[Dict]:
+    def deduplicate_chunks(self, chunks: List[ScoredChunk], similarity_threshold: float = 0.85) -> List[ScoredChunk]:
         if not chunks:
             return []
         
-        seen_fingerprints = set()
+        seen_word_sets = []
         unique_chunks = []
         
         for chunk in chunks:
-            text = chunk.get('text', '')
-            fingerprint = text[:300].strip().lower()
+            fp_words = set(chunk.text[:300].strip().lower().split())
             
             is_duplicate = False
-            for seen_fp in seen_fingerprints:
-                if len(fingerprint) > 0 and len(seen_fp) > 0:
-                    fp_words = set(fingerprint.split())
-                    seen_words = set(seen_fp.split())
-                    
-                    if len(fp_words) > 0:
-                        overlap = len(fp_words.intersection(seen_words)) / len(fp_words)
-                        if overlap > similarity_threshold:
-                            is_duplicate = True
-                            break
+            if fp_words:
+                for seen_words in seen_word_sets:
+                    overlap = len(fp_words.intersection(seen_words)) / len(fp_words)
+                    if overlap > similarity_threshold:
+                        is_duplicate = True
+                        break
             
             if not is_duplicate:
-                seen_fingerprints.add(fingerprint)
+                if fp_words:
+                    seen_word_sets.append(fp_words)
                 unique_chunks.append(chunk)
         
         logger.info(f"Deduplicated: {len(chunks)} -> {len(unique_chunks)} chunks")
         return unique_chunks
     
-    def diversify_results(self, chunks: List[Dict], diversity_threshold: int = 2) -> List[Dict]:
+    def diversify_results(self, chunks: List[ScoredChunk], diversity_threshold: int = 2) -> List[ScoredChunk]:
         if not chunks:
             return []
         
         section_counts = Counter()
         diversified = []
+        remaining = []
         
         for chunk in chunks:
-            section = chunk['metadata'].get('section_title', 'unknown')
+            section = chunk.metadata.get('section_title', 'unknown')
             
             if section_counts[section] < diversity_threshold:
                 diversified.append(chunk)
                 section_counts[section] += 1
+            else:
+                remaining.append(chunk)
         
         if len(diversified) < len(chunks) // 2:
-            remaining = [c for c in chunks if c not in diversified]
             diversified.extend(remaining[:diversity_threshold])
         
         logger.info(f"Diversified results: {len(chunks)} -> {len(diversified)} chunks")
@@ -227,10 +279,10 @@ class ReRanker:
     
     def rerank(
         self,
-        chunks: List[Dict],
+        chunks: List[ScoredChunk],
         remove_duplicates: bool = True,
         ensure_diversity: bool = True
-    ) -> List[Dict]:
+    ) -> List[ScoredChunk]:
         if not chunks:
             return []
         
@@ -247,17 +299,22 @@ class ReRanker:
 
 _hybrid_search_service = None
 _reranker = None
+_singleton_lock = threading.Lock()
 
 
 def get_hybrid_search_service() -> HybridSearchService:
     global _hybrid_search_service
     if _hybrid_search_service is None:
-        _hybrid_search_service = HybridSearchService()
+        with _singleton_lock:
+            if _hybrid_search_service is None:
+                _hybrid_search_service = HybridSearchService()
     return _hybrid_search_service
 
 
 def get_reranker() -> ReRanker:
     global _reranker
     if _reranker is None:
-        _reranker = ReRanker()
+        with _singleton_lock:
+            if _reranker is None:
+                _reranker = ReRanker()
     return _reranker
@@ -1,91 +1,304 @@
 """Azure OpenAI LLM service"""
 
-from typing import List, Dict, Tuple, Optional
-from openai import AzureOpenAI
+from collections import OrderedDict
+from typing import AsyncIterator, List, Dict, Tuple, Optional
+from openai import AsyncAzureOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
 import asyncio
+import hashlib
+import httpx
+import numpy as np
+import re
+import threading
 
 from backend.app.core.config import settings
-from backend.app.core.prompts import SYSTEM_PROMPT, SUMMARIZATION_PROMPT
+from backend.app.core.prompts import (
+    SYSTEM_PROMPT_FRAGMENTS,
+    SUMMARIZATION_PROMPT_FRAGMENTS,
+    render_prompt
+)
+from backend.app.services.embeddings import get_embedding_batcher
+from backend.app.services.hybrid_search import ScoredChunk
+from backend.app.services.semantic_cache import (
+    get_semantic_cache,
+    get_response_cache,
+    make_context_key,
+    make_response_key,
+    make_semantic_scope_key
+)
 from backend.app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+CONTEXT_SEPARATOR = "=" * 80
+FORMATTED_CONTEXT_CACHE_SIZE = 256
+SUMMARY_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful assistant that summarizes conversations concisely."
+}
+
+SIMHASH_TOKEN_PATTERN = re.compile(r'\w+')
+SIMHASH_BITS = 64
+# Chunks whose fingerprints differ in fewer bits than this are near-duplicates
+SIMHASH_MAX_DISTANCE = 3
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash fingerprint over the lowercased word tokens of text"""
+    tokens = SIMHASH_TOKEN_PATTERN.findall(text.lower())
+    if not tokens:
+        return 0
+    
+    digests = b"".join(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest() for token in tokens)
+    # One row of 64 bits per token, most significant bit first
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(tokens), 8), axis=1)
+    # A bit's +1/-1 votes sum to a positive weight exactly when it is set in over half the tokens
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(tokens)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
 
 class LLMService:
     """Azure OpenAI service wrapper"""
     
     def __init__(self):
         logger.info("Initializing Azure OpenAI client")
-        self.client = AzureOpenAI(
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections
+            ),
+            timeout=httpx.Timeout(
+                settings.llm_timeout_seconds,
+                connect=settings.llm_connect_timeout_seconds
+            )
+        )
+        self.client = AsyncAzureOpenAI(
             api_key=settings.azure_openai_key,
             api_version=settings.azure_openai_api_version,
-            azure_endpoint=settings.azure_openai_endpoint
+            azure_endpoint=settings.azure_openai_endpoint,
+            http_client=self.http_client,
+            # Retries are handled by _create_chat so they are not compounded
+            max_retries=0
         )
         self.deployment = settings.azure_openai_deployment
+        self.semantic_cache = get_semantic_cache() if settings.semantic_cache_enabled else None
+        self.response_cache = get_response_cache() if settings.response_cache_enabled else None
+        self._pending_answers: Dict[str, asyncio.Task] = {}
+        self._formatted_contexts: OrderedDict = OrderedDict()
     
     async def generate_answer(
         self,
         query: str,
-        context: List[Dict],
-        memory: str
+        context: List[ScoredChunk],
+        memory: str,
+        query_embedding: Optional[List[float]] = None,
+        embedding_query: Optional[str] = None
     ) -> Tuple[str, List[str]]:
         """Generate answer using Azure OpenAI"""
-        context_text = self._format_context(context)
+        context_key = make_context_key(context)
+        response_key = make_response_key(query, memory, context_key)
+        # Semantic hits must share the conversation memory too, so one session's answer never reaches another
+        scope_key = make_semantic_scope_key(memory, context_key)
         
-        system_message = SYSTEM_PROMPT.format(
-            context=context_text,
-            memory=memory,
-            query=query
+        cached, query_embedding = await self._get_cached_answer(
+            embedding_query or query, scope_key, response_key, query_embedding
         )
+        if cached is not None:
+            return cached
         
-        messages = [
-            {"role": "system", "content": system_message}
-        ]
+        # Identical requests that arrive while one is in flight share its completion
+        pending = self._pending_answers.get(response_key)
+        if pending is None:
+            pending = asyncio.create_task(self._complete_answer(
+                query, context, memory, query_embedding, scope_key, response_key
+            ))
+            self._pending_answers[response_key] = pending
+            pending.add_done_callback(lambda _: self._pending_answers.pop(response_key, None))
+        else:
+            logger.info("Joining in-flight generation for an identical request")
+        
+        answer, sources = await asyncio.shield(pending)
+        return answer, list(sources)
+    
+    async def _complete_answer(
+        self,
+        query: str,
+        context: List[ScoredChunk],
+        memory: str,
+        query_embedding: Optional[List[float]],
+        scope_key: str,
+        response_key: str
+    ) -> Tuple[str, List[str]]:
+        messages = self._build_messages(query, context, memory)
         
         try:
-            logger.info(f"Generating answer for query: {query[:100]}...")
+            logger.info("Generating answer for query: %.100s...", query)
             
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.deployment,
+            response = await self._create_chat(
                 messages=messages,
-                temperature=settings.llm_temperature,
-                max_tokens=settings.llm_max_tokens,
-                top_p=0.95,
-                frequency_penalty=0,
-                presence_penalty=0
+                **self._completion_params()
             )
             
             answer = response.choices[0].message.content
+            sources = self.get_sources(context)
             
-            sources = list(set([
-                chunk['metadata']['section_title']
-                for chunk in context
-                if chunk['metadata'].get('section_title')
-            ]))
+            self._cache_answer(response_key, query_embedding, scope_key, answer, sources)
             
             logger.info("Answer generated successfully")
             return answer, sources
             
         except Exception as e:
-            logger.error(f"Error generating answer: {str(e)}")
+            logger.error("Error generating answer: %s", e)
             raise
     
+    async def stream_answer(
+        self,
+        query: str,
+        context: List[ScoredChunk],
+        memory: str,
+        query_embedding: Optional[List[float]] = None,
+        embedding_query: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream answer text deltas from Azure OpenAI as they are generated"""
+        context_key = make_context_key(context)
+        response_key = make_response_key(query, memory, context_key)
+        scope_key = make_semantic_scope_key(memory, context_key)
+        
+        cached, query_embedding = await self._get_cached_answer(
+            embedding_query or query, scope_key, response_key, query_embedding
+        )
+        if cached is not None:
+            yield cached[0]
+            return
+        
+        messages = self._build_messages(query, context, memory)
+        
+        try:
+            logger.info("Streaming answer for query: %.100s...", query)
+            
+            stream = await self._create_chat(
+                messages=messages,
+                stream=True,
+                **self._completion_params()
+            )
+            
+            parts = []
+            async for event in stream:
+                # Azure sends content filter results in events without choices
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            
+            self._cache_answer(response_key, query_embedding, scope_key, "".join(parts), self.get_sources(context))
+            
+            logger.info("Answer streamed successfully")
+            
+        except Exception as e:
+            logger.error("Error streaming answer: %s", e)
+            raise
+    
+    @retry(
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+        wait=wait_exponential_jitter(initial=0.5, max=8.0),
+        stop=stop_after_attempt(settings.llm_max_attempts),
+        reraise=True
+    )
+    async def _create_chat(self, **kwargs):
+        """Chat completion call retried with jittered exponential backoff on transient errors"""
+        return await self.client.chat.completions.create(model=self.deployment, **kwargs)
+    
+    async def _get_cached_answer(
+        self,
+        embedding_query: str,
+        scope_key: str,
+        response_key: str,
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[Optional[Tuple[str, List[str]]], Optional[List[float]]]:
+        """Check the exact cache, then the semantic cache; returns the hit and the query embedding
+        
+        embedding_query is the text retrieval embeds, so lazily computed embeddings
+        match the ones semantic cache entries are stored under.
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.get(response_key)
+            if cached is not None:
+                return cached, query_embedding
+        
+        if self.semantic_cache is None:
+            return None, query_embedding
+        
+        if query_embedding is None:
+            query_embedding = await get_embedding_batcher().embed(embedding_query)
+        return self.semantic_cache.lookup(query_embedding, scope_key), query_embedding
+    
+    def _cache_answer(
+        self,
+        response_key: str,
+        query_embedding: Optional[List[float]],
+        scope_key: str,
+        answer: str,
+        sources: List[str]
+    ):
+        if self.response_cache is not None:
+            self.response_cache.put(response_key, answer, sources)
+        if self.semantic_cache is not None and query_embedding is not None:
+            self.semantic_cache.add(query_embedding, answer, sources, scope_key)
+    
+    async def close(self):
+        """Release pooled connections to Azure OpenAI"""
+        await self.http_client.aclose()
+        logger.info("Azure OpenAI client closed")
+    
+    def get_sources(self, context: List[ScoredChunk]) -> List[str]:
+        """Documentation sections cited by the context, in retrieval order"""
+        return list(dict.fromkeys(
+            chunk.metadata['section_title']
+            for chunk in context
+            if chunk.metadata.get('section_title')
+        ))
+    
+    def _build_messages(self, query: str, context: List[ScoredChunk], memory: str) -> List[Dict]:
+        context_text = self._get_formatted_context(context)
+        
+        system_message = render_prompt(
+            SYSTEM_PROMPT_FRAGMENTS,
+            context=context_text,
+            memory=memory,
+            query=query
+        )
+        
+        return [
+            {"role": "system", "content": system_message}
+        ]
+    
+    def _completion_params(self) -> Dict:
+        return {
+            "temperature": settings.llm_temperature,
+            "max_tokens": settings.llm_max_tokens,
+            "top_p": 0.95,
+            "frequency_penalty": 0,
+            "presence_penalty": 0
+        }
+    
     async def summarize_conversation(self, conversation: str) -> str:
         """Summarize a conversation"""
-        prompt = SUMMARIZATION_PROMPT.format(conversation=conversation)
-        
         messages = [
-            {"role": "system", "content": "You are a helpful assistant that summarizes conversations concisely."},
-            {"role": "user", "content": prompt}
+            SUMMARY_SYSTEM_MESSAGE,
+            {"role": "user", "content": render_prompt(SUMMARIZATION_PROMPT_FRAGMENTS, conversation=conversation)}
         ]
         
         try:
             logger.info("Generating conversation summary")
             
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.deployment,
+            response = await self._create_chat(
                 messages=messages,
                 temperature=0.3,
                 max_tokens=300
@@ -96,53 +309,77 @@ class LLMService:
             return summary
             
         except Exception as e:
-            logger.error(f"Error generating summary: {str(e)}")
+            logger.error("Error generating summary: %s", e)
             return "Summary generation failed. Continuing with recent conversation history."
     
-    def _format_context(self, context: List[Dict]) -> str:
+    def _get_formatted_context(self, context: List[ScoredChunk]) -> str:
+        """Formatted context for a chunk set, reused when the same chunks are retrieved again"""
+        context_key = make_context_key(context)
+        context_text = self._formatted_contexts.get(context_key)
+        if context_text is not None:
+            self._formatted_contexts.move_to_end(context_key)
+            return context_text
+        
+        # Near-duplicate chunks only repeat text in the prompt, so they are dropped here
+        context_text = self._format_context(self._deduplicate_chunks(context))
+        self._formatted_contexts[context_key] = context_text
+        if len(self._formatted_contexts) > FORMATTED_CONTEXT_CACHE_SIZE:
+            self._formatted_contexts.popitem(last=False)
+        return context_text
+    
+    def _format_context(self, context: List[ScoredChunk]) -> str:
         """Format retrieved chunks into context string"""
         if not context:
             return "No relevant documentation found."
         
-        formatted_chunks = []
-        for i, chunk in enumerate(context, 1):
-            section = chunk['metadata'].get('section_title', 'Unknown Section')
-            api_endpoint = chunk['metadata'].get('api_endpoint', '')
-            text = chunk.get('text', '')
-            
-            source_label = f"[Source {i}: {section}"
-            if api_endpoint:
-                source_label += f" | Endpoint: {api_endpoint}"
-            source_label += "]"
-            
-            formatted_chunk = f"{source_label}\n{text}\n{'=' * 80}\n"
-            formatted_chunks.append(formatted_chunk)
-        
-        return "\n".join(formatted_chunks)
+        return "\n".join(
+            f"[Source {i}: {chunk.metadata.get('section_title', 'Unknown Section')}"
+            f"{self._endpoint_label(chunk.metadata.get('api_endpoint', ''))}]\n"
+            f"{chunk.text}\n{CONTEXT_SEPARATOR}\n"
+            for i, chunk in enumerate(context, 1)
+        )
+    
+    def _endpoint_label(self, api_endpoint: str) -> str:
+        return f" | Endpoint: {api_endpoint}" if api_endpoint else ""
     
-    def _deduplicate_chunks(self, chunks: List[Dict]) -> List[Dict]:
+    def _deduplicate_chunks(self, chunks: List[ScoredChunk]) -> List[ScoredChunk]:
         if not chunks:
             return []
         
-        seen_texts = set()
+        seen = set()
+        kept_fingerprints = []
         unique_chunks = []
         
         for chunk in chunks:
-            text = chunk.get('text', '')
-            fingerprint = text[:200].strip()
+            fingerprint = simhash(chunk.text)
             
-            if fingerprint not in seen_texts:
-                seen_texts.add(fingerprint)
-                unique_chunks.append(chunk)
+            if fingerprint in seen:
+                continue
+            if any((fingerprint ^ kept).bit_count() < SIMHASH_MAX_DISTANCE for kept in kept_fingerprints):
+                continue
+            
+            seen.add(fingerprint)
+            kept_fingerprints.append(fingerprint)
+            unique_chunks.append(chunk)
         
         return unique_chunks
 
 
 _llm_service = None
+_llm_service_lock = threading.Lock()
 
 
 def get_llm_service() -> LLMService:
     global _llm_service
     if _llm_service is None:
-        _llm_service = LLMService()
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService()
     return _llm_service
+
+
+async def close_llm_service():
+    global _llm_service
+    if _llm_service is not None:
+        await _llm_service.close()
+        _llm_service = None
@@ -1,66 +1,124 @@
 """Session memory management with summarization"""
 
-from typing import Dict, List, Optional
-from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import islice
+import asyncio
+import heapq
+import orjson
+import time
 import uuid
 
 from backend.app.core.config import settings
 from backend.app.core.prompts import SUMMARIZATION_PROMPT
+from backend.app.services.hybrid_search import ScoredChunk
 from backend.app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+UNIX_EPOCH = datetime(1970, 1, 1)
+NANOSECONDS_PER_HOUR = 3600 * 10**9
+
+
+def ns_to_iso(timestamp_ns: int) -> str:
+    """Format a time.time_ns() value as a naive UTC ISO-8601 string"""
+    return (UNIX_EPOCH + timedelta(microseconds=timestamp_ns // 1000)).isoformat()
+
+
+def iso_to_ns(timestamp: str) -> int:
+    return (datetime.fromisoformat(timestamp) - UNIX_EPOCH) // timedelta(microseconds=1) * 1000
+
 
 class ConversationTurn:
     """Single conversation turn"""
     
-    def __init__(self, role: str, content: str):
+    __slots__ = ("role", "content", "timestamp_ns", "_dict")
+    
+    def __init__(self, role: str, content: str, timestamp_ns: int = None):
         self.role = role
         self.content = content
-        self.timestamp = datetime.utcnow()
+        self.timestamp_ns = timestamp_ns or time.time_ns()
+        self._dict: Optional[Dict] = None
+    
+    @property
+    def timestamp_iso(self) -> str:
+        return ns_to_iso(self.timestamp_ns)
     
     def to_dict(self) -> Dict:
-        return {
-            "role": self.role,
-            "content": self.content,
-            "timestamp": self.timestamp.isoformat()
-        }
+        """Shared dict view of the turn, built on first use; callers must treat it as read-only"""
+        if self._dict is None:
+            self._dict = {
+                "role": self.role,
+                "content": self.content,
+                "timestamp": self.timestamp_iso
+            }
+        return self._dict
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ConversationTurn":
+        turn = cls(data["role"], data["content"], iso_to_ns(data["timestamp"]))
+        turn._dict = data
+        return turn
 
 
 class SessionMemory:
     """Memory for a single conversation session"""
     
+    __slots__ = (
+        "session_id",
+        "turns",
+        "total_turns",
+        "summary",
+        "created_at_ns",
+        "last_accessed_ns",
+        "last_retrieved_chunks",
+        "last_query",
+        "_context_cache"
+    )
+    
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.turns: List[ConversationTurn] = []
+        self.turns: Deque[ConversationTurn] = deque(maxlen=settings.max_session_turns)
+        self.total_turns = 0
         self.summary: Optional[str] = None
-        self.created_at = datetime.utcnow()
-        self.last_accessed = datetime.utcnow()
-        self.last_retrieved_chunks: List[Dict] = []
+        self.created_at_ns = time.time_ns()
+        self.last_accessed_ns = self.created_at_ns
+        self.last_retrieved_chunks: List[ScoredChunk] = []
         self.last_query: Optional[str] = None
+        self._context_cache: Optional[str] = None
     
     def add_turn(self, role: str, content: str):
         turn = ConversationTurn(role, content)
         self.turns.append(turn)
-        self.last_accessed = datetime.utcnow()
+        self.total_turns += 1
+        self.last_accessed_ns = time.time_ns()
+        self._context_cache = None
     
     def get_recent_turns(self, n: int = None) -> List[Dict]:
         if n is None:
             n = settings.max_conversation_turns
-        return [turn.to_dict() for turn in self.turns[-n:]]
+        return [turn.to_dict() for turn in self._tail(n)]
     
     def get_all_turns(self) -> List[Dict]:
         return [turn.to_dict() for turn in self.turns]
     
-    def needs_summarization(self) -> bool:
-        return len(self.turns) > settings.max_conversation_turns and self.summary is None
+    def needs_summarization(self, upcoming_turns: int = 0) -> bool:
+        """Whether older turns need a summary once upcoming_turns more have been added"""
+        return len(self.turns) + upcoming_turns > settings.max_conversation_turns and self.summary is None
     
     def set_summary(self, summary: str):
         self.summary = summary
-        logger.info(f"Summary set for session {self.session_id}")
+        self._context_cache = None
+        logger.info("Summary set for session %s", self.session_id)
     
     def get_context_for_llm(self) -> str:
-        """Get formatted context for LLM"""
+        """Get formatted context for LLM, reusing it until the turns or summary change"""
+        if self._context_cache is None:
+            self._context_cache = self._build_context_for_llm()
+        return self._context_cache
+    
+    def _build_context_for_llm(self) -> str:
         if not self.turns:
             return "No previous conversation."
         
@@ -68,18 +126,20 @@ class SessionMemory:
             return self._format_turns(self.turns)
         
         if self.summary:
-            recent_turns = self.turns[-4:]
+            recent_turns = self._tail(4)
             context = f"Previous conversation summary:\n{self.summary}\n\n"
             context += "Recent conversation:\n"
             context += self._format_turns(recent_turns)
             return context
         else:
-            recent_turns = self.turns[-settings.max_conversation_turns:]
+            recent_turns = self._tail(settings.max_conversation_turns)
             return self._format_turns(recent_turns)
     
     def get_conversation_for_query_rewrite(self) -> List[Dict]:
-        recent_turns = self.turns[-5:] if len(self.turns) >= 5 else self.turns
-        return [turn.to_dict() for turn in recent_turns]
+        return [turn.to_dict() for turn in self._tail(5)]
+    
+    def _tail(self, n: int) -> List[ConversationTurn]:
+        return list(islice(self.turns, max(0, len(self.turns) - n), None))
     
     def _format_turns(self, turns: List[ConversationTurn]) -> str:
         formatted = []
@@ -89,15 +149,18 @@ class SessionMemory:
         return "\n".join(formatted)
     
     def get_turns_for_summarization(self) -> str:
-        turns_to_summarize = self.turns[:-3] if len(self.turns) > 3 else self.turns
+        if len(self.turns) > 3:
+            turns_to_summarize = list(islice(self.turns, len(self.turns) - 3))
+        else:
+            turns_to_summarize = self.turns
         return self._format_turns(turns_to_summarize)
     
-    def cache_retrieved_chunks(self, chunks: List[Dict], query: str):
+    def cache_retrieved_chunks(self, chunks: List[ScoredChunk], query: str):
         self.last_retrieved_chunks = chunks
         self.last_query = query
-        logger.info(f"Cached {len(chunks)} chunks for session {self.session_id}")
+        logger.info("Cached %d chunks for session %s", len(chunks), self.session_id)
     
-    def get_cached_chunks(self) -> List[Dict]:
+    def get_cached_chunks(self) -> List[ScoredChunk]:
         return self.last_retrieved_chunks
     
     def has_cached_chunks(self) -> bool:
@@ -112,120 +175,369 @@ class MemoryManager:
     
     def __init__(self):
         self.sessions: Dict[str, SessionMemory] = {}
+        # One (last_accessed_ns, session_id, created_at_ns) entry per session; the tick may be
+        # stale but never newer than the session's, so cleanup can stop early. Entries left
+        # by cleared sessions are told apart from a recreated session by created_at_ns
+        self._expiry_heap: List[Tuple[int, str, int]] = []
+        self._session_locks: Dict[str, asyncio.Lock] = {}
         logger.info("Memory manager initialized")
     
+    def get_session_lock(self, session_id: str) -> asyncio.Lock:
+        """Lock serializing multi-step updates (such as summarization) to one session"""
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+    
     def get_session(self, session_id: str) -> SessionMemory:
         if session_id not in self.sessions:
-            logger.info(f"Creating new session: {session_id}")
-            self.sessions[session_id] = SessionMemory(session_id)
+            logger.info("Creating new session: %s", session_id)
+            session = SessionMemory(session_id)
+            self.sessions[session_id] = session
+            heapq.heappush(self._expiry_heap, (session.last_accessed_ns, session_id, session.created_at_ns))
         else:
-            self.sessions[session_id].last_accessed = datetime.utcnow()
+            self.sessions[session_id].last_accessed_ns = time.time_ns()
         
         return self.sessions[session_id]
     
-    def add_user_message(self, session_id: str, message: str):
+    async def start_turn(self, session_id: str, message: str) -> Tuple[List[Dict], bool]:
+        """Record the user's message; returns the recent turns for query rewriting and whether chunks are cached"""
+        session = self.get_session(session_id)
+        session.add_turn("user", message)
+        return session.get_conversation_for_query_rewrite(), session.has_cached_chunks()
+    
+    async def finish_turn(
+        self,
+        session_id: str,
+        answer: str,
+        chunks: Optional[List[ScoredChunk]] = None,
+        query: Optional[str] = None
+    ):
+        """Record the assistant's answer and, when given, the chunks it was generated from"""
+        session = self.get_session(session_id)
+        session.add_turn("assistant", answer)
+        if chunks is not None:
+            session.cache_retrieved_chunks(chunks, query)
+    
+    async def add_user_message(self, session_id: str, message: str):
         session = self.get_session(session_id)
         session.add_turn("user", message)
     
-    def add_assistant_message(self, session_id: str, message: str):
+    async def add_assistant_message(self, session_id: str, message: str):
         session = self.get_session(session_id)
         session.add_turn("assistant", message)
     
-    def get_context(self, session_id: str) -> str:
+    async def get_context(self, session_id: str) -> str:
         session = self.get_session(session_id)
         return session.get_context_for_llm()
     
-    def get_conversation_for_query_rewrite(self, session_id: str) -> List[Dict]:
+    async def get_conversation_for_query_rewrite(self, session_id: str) -> List[Dict]:
         if session_id not in self.sessions:
             return []
         session = self.get_session(session_id)
         return session.get_conversation_for_query_rewrite()
     
-    def needs_summarization(self, session_id: str) -> bool:
+    async def needs_summarization(self, session_id: str, upcoming_turns: int = 0) -> bool:
         if session_id not in self.sessions:
             return False
-        return self.sessions[session_id].needs_summarization()
+        return self.sessions[session_id].needs_summarization(upcoming_turns)
     
-    def set_summary(self, session_id: str, summary: str):
+    async def set_summary(self, session_id: str, summary: str):
         session = self.get_session(session_id)
         session.set_summary(summary)
     
-    def get_turns_for_summarization(self, session_id: str) -> str:
+    async def get_turns_for_summarization(self, session_id: str) -> str:
         session = self.get_session(session_id)
         return session.get_turns_for_summarization()
     
-    def cache_retrieved_chunks(self, session_id: str, chunks: List[Dict], query: str):
+    async def cache_retrieved_chunks(self, session_id: str, chunks: List[ScoredChunk], query: str):
         session = self.get_session(session_id)
         session.cache_retrieved_chunks(chunks, query)
     
-    def get_cached_chunks(self, session_id: str) -> List[Dict]:
+    async def get_cached_chunks(self, session_id: str) -> List[ScoredChunk]:
         if session_id not in self.sessions:
             return []
         session = self.get_session(session_id)
         return session.get_cached_chunks()
     
-    def has_cached_chunks(self, session_id: str) -> bool:
+    async def has_cached_chunks(self, session_id: str) -> bool:
         if session_id not in self.sessions:
             return False
         session = self.get_session(session_id)
         return session.has_cached_chunks()
     
-    def get_last_query(self, session_id: str) -> Optional[str]:
+    async def get_last_query(self, session_id: str) -> Optional[str]:
         if session_id not in self.sessions:
             return None
         session = self.get_session(session_id)
         return session.get_last_query()
     
-    def get_session_stats(self, session_id: str) -> Dict:
+    async def get_session_stats(self, session_id: str) -> Dict:
         if session_id not in self.sessions:
             return {"exists": False}
         
         session = self.sessions[session_id]
         return {
             "exists": True,
-            "total_turns": len(session.turns),
+            "total_turns": session.total_turns,
             "has_summary": session.summary is not None,
-            "created_at": session.created_at.isoformat(),
-            "last_accessed": session.last_accessed.isoformat()
+            "created_at": ns_to_iso(session.created_at_ns),
+            "last_accessed": ns_to_iso(session.last_accessed_ns)
         }
     
-    def clear_session(self, session_id: str) -> bool:
+    async def clear_session(self, session_id: str) -> bool:
         if session_id in self.sessions:
             del self.sessions[session_id]
-            logger.info(f"Session cleared: {session_id}")
+            self._session_locks.pop(session_id, None)
+            logger.info("Session cleared: %s", session_id)
             return True
         return False
     
-    def get_all_sessions(self) -> List[str]:
+    async def get_all_sessions(self) -> List[str]:
         return list(self.sessions.keys())
     
-    def cleanup_old_sessions(self, hours: int = 24):
-        from datetime import timedelta
+    async def cleanup_old_sessions(self, hours: int = 24):
+        cutoff_ns = time.time_ns() - hours * NANOSECONDS_PER_HOUR
         
-        now = datetime.utcnow()
-        cutoff = now - timedelta(hours=hours)
+        refreshed = []
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] < cutoff_ns:
+            _, session_id, created_at_ns = heapq.heappop(self._expiry_heap)
+            session = self.sessions.get(session_id)
+            # Dropped: the session was cleared, and possibly recreated with its own entry
+            if session is None or session.created_at_ns != created_at_ns:
+                continue
+            
+            if session.last_accessed_ns < cutoff_ns:
+                del self.sessions[session_id]
+                self._session_locks.pop(session_id, None)
+                removed += 1
+                logger.info("Cleaned up old session: %s", session_id)
+            else:
+                refreshed.append((session.last_accessed_ns, session_id, created_at_ns))
         
-        sessions_to_remove = []
-        for session_id, session in self.sessions.items():
-            if session.last_accessed < cutoff:
-                sessions_to_remove.append(session_id)
+        for entry in refreshed:
+            heapq.heappush(self._expiry_heap, entry)
         
-        for session_id in sessions_to_remove:
-            del self.sessions[session_id]
-            logger.info(f"Cleaned up old session: {session_id}")
+        return removed
+    
+    async def close(self):
+        """Nothing to release; sessions live in this process"""
+
+
+class RedisMemoryManager:
+    """Conversation memory shared across worker processes through Redis
+    
+    Each session is stored as a capped LIST of JSON turns, a HASH of session
+    fields (summary, timestamps, turn count, last query) and a short-lived key
+    holding the last retrieved chunks. All keys expire after the session TTL,
+    so Redis takes over the job of cleanup_old_sessions.
+    """
+    
+    def __init__(self, redis_url: str):
+        from redis import asyncio as aioredis
+        
+        self.redis = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        self.session_ttl_seconds = settings.session_ttl_hours * 3600
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        logger.info("Redis memory manager initialized")
+    
+    def get_session_lock(self, session_id: str) -> asyncio.Lock:
+        """Lock serializing multi-step updates to one session within this worker"""
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+    
+    def _turns_key(self, session_id: str) -> str:
+        return f"session:{session_id}:turns"
+    
+    def _meta_key(self, session_id: str) -> str:
+        return f"session:{session_id}:meta"
+    
+    def _chunks_key(self, session_id: str) -> str:
+        return f"session:{session_id}:chunks"
+    
+    def _touch(self, pipe, session_id: str):
+        now = time.time_ns()
+        pipe.hsetnx(self._meta_key(session_id), "created_at", now)
+        pipe.hset(self._meta_key(session_id), "last_accessed", now)
+        pipe.expire(self._meta_key(session_id), self.session_ttl_seconds)
+        pipe.expire(self._turns_key(session_id), self.session_ttl_seconds)
+    
+    async def _load_session(self, session_id: str) -> Optional[SessionMemory]:
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._meta_key(session_id))
+        pipe.lrange(self._turns_key(session_id), 0, -1)
+        meta, raw_turns = await pipe.execute()
         
-        return len(sessions_to_remove)
+        if not meta:
+            return None
+        
+        session = SessionMemory(session_id)
+        session.turns.extend(ConversationTurn.from_dict(orjson.loads(raw)) for raw in raw_turns)
+        session.total_turns = int(meta.get("total_turns", 0))
+        session.summary = meta.get("summary")
+        session.created_at_ns = int(meta["created_at"])
+        session.last_accessed_ns = int(meta["last_accessed"])
+        session.last_query = meta.get("last_query")
+        return session
+    
+    async def _get_session(self, session_id: str) -> SessionMemory:
+        return await self._load_session(session_id) or SessionMemory(session_id)
+    
+    def _queue_turn(self, pipe, session_id: str, role: str, content: str):
+        turn = ConversationTurn(role, content)
+        pipe.rpush(self._turns_key(session_id), orjson.dumps(turn.to_dict()))
+        pipe.ltrim(self._turns_key(session_id), -settings.max_session_turns, -1)
+        pipe.hincrby(self._meta_key(session_id), "total_turns", 1)
+        self._touch(pipe, session_id)
+    
+    def _queue_chunks(self, pipe, session_id: str, chunks: List[ScoredChunk], query: str):
+        pipe.setex(
+            self._chunks_key(session_id),
+            settings.chunk_cache_ttl_seconds,
+            orjson.dumps(chunks)
+        )
+        pipe.hset(self._meta_key(session_id), "last_query", query)
+    
+    async def start_turn(self, session_id: str, message: str) -> Tuple[List[Dict], bool]:
+        """Record the user's message; returns the recent turns for query rewriting and whether chunks are cached"""
+        pipe = self.redis.pipeline()
+        self._queue_turn(pipe, session_id, "user", message)
+        pipe.lrange(self._turns_key(session_id), -5, -1)
+        pipe.exists(self._chunks_key(session_id))
+        *_, raw_turns, chunks_cached = await pipe.execute()
+        return [orjson.loads(raw) for raw in raw_turns], chunks_cached > 0
+    
+    async def finish_turn(
+        self,
+        session_id: str,
+        answer: str,
+        chunks: Optional[List[ScoredChunk]] = None,
+        query: Optional[str] = None
+    ):
+        """Record the assistant's answer and, when given, the chunks it was generated from"""
+        pipe = self.redis.pipeline()
+        self._queue_turn(pipe, session_id, "assistant", answer)
+        if chunks is not None:
+            self._queue_chunks(pipe, session_id, chunks, query)
+        await pipe.execute()
+        if chunks is not None:
+            logger.info("Cached %d chunks for session %s", len(chunks), session_id)
+    
+    async def add_user_message(self, session_id: str, message: str):
+        pipe = self.redis.pipeline()
+        self._queue_turn(pipe, session_id, "user", message)
+        await pipe.execute()
+    
+    async def add_assistant_message(self, session_id: str, message: str):
+        await self.finish_turn(session_id, message)
+    
+    async def get_context(self, session_id: str) -> str:
+        return (await self._get_session(session_id)).get_context_for_llm()
+    
+    async def get_conversation_for_query_rewrite(self, session_id: str) -> List[Dict]:
+        session = await self._load_session(session_id)
+        if session is None:
+            return []
+        return session.get_conversation_for_query_rewrite()
+    
+    async def needs_summarization(self, session_id: str, upcoming_turns: int = 0) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.llen(self._turns_key(session_id))
+        pipe.hexists(self._meta_key(session_id), "summary")
+        turn_count, has_summary = await pipe.execute()
+        return turn_count + upcoming_turns > settings.max_conversation_turns and not has_summary
+    
+    async def set_summary(self, session_id: str, summary: str):
+        pipe = self.redis.pipeline()
+        pipe.hset(self._meta_key(session_id), "summary", summary)
+        self._touch(pipe, session_id)
+        await pipe.execute()
+        logger.info("Summary set for session %s", session_id)
+    
+    async def get_turns_for_summarization(self, session_id: str) -> str:
+        return (await self._get_session(session_id)).get_turns_for_summarization()
+    
+    async def cache_retrieved_chunks(self, session_id: str, chunks: List[ScoredChunk], query: str):
+        pipe = self.redis.pipeline()
+        self._queue_chunks(pipe, session_id, chunks, query)
+        self._touch(pipe, session_id)
+        await pipe.execute()
+        logger.info("Cached %d chunks for session %s", len(chunks), session_id)
+    
+    async def get_cached_chunks(self, session_id: str) -> List[ScoredChunk]:
+        raw = await self.redis.get(self._chunks_key(session_id))
+        if not raw:
+            return []
+        return [ScoredChunk(**chunk) for chunk in orjson.loads(raw)]
+    
+    async def has_cached_chunks(self, session_id: str) -> bool:
+        return await self.redis.exists(self._chunks_key(session_id)) > 0
+    
+    async def get_last_query(self, session_id: str) -> Optional[str]:
+        return await self.redis.hget(self._meta_key(session_id), "last_query")
+    
+    async def get_session_stats(self, session_id: str) -> Dict:
+        meta = await self.redis.hgetall(self._meta_key(session_id))
+        if not meta:
+            return {"exists": False}
+        
+        return {
+            "exists": True,
+            "total_turns": int(meta.get("total_turns", 0)),
+            "has_summary": "summary" in meta,
+            "created_at": ns_to_iso(int(meta["created_at"])),
+            "last_accessed": ns_to_iso(int(meta["last_accessed"]))
+        }
+    
+    async def clear_session(self, session_id: str) -> bool:
+        deleted = await self.redis.delete(
+            self._meta_key(session_id),
+            self._turns_key(session_id),
+            self._chunks_key(session_id)
+        )
+        self._session_locks.pop(session_id, None)
+        if deleted:
+            logger.info("Session cleared: %s", session_id)
+            return True
+        return False
+    
+    async def get_all_sessions(self) -> List[str]:
+        return [
+            key[len("session:"):-len(":meta")]
+            async for key in self.redis.scan_iter(match="session:*:meta")
+        ]
+    
+    async def cleanup_old_sessions(self, hours: int = 24):
+        # Session keys expire on their own after session_ttl_hours
+        return 0
+    
+    async def close(self):
+        """Release the Redis connection pool"""
+        await self.redis.aclose()
 
 
 _memory_manager = None
 
 
-def get_memory_manager() -> MemoryManager:
+def get_memory_manager():
     global _memory_manager
     if _memory_manager is None:
-        _memory_manager = MemoryManager()
+        if settings.redis_url:
+            _memory_manager = RedisMemoryManager(settings.redis_url)
+        else:
+            _memory_manager = MemoryManager()
     return _memory_manager
 
 
+async def close_memory_manager():
+    global _memory_manager
+    if _memory_manager is not None:
+        await _memory_manager.close()
+        _memory_manager = None
+
+
 def generate_session_id() -> str:
     return str(uuid.uuid4())
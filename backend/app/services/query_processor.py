@@ -1,12 +1,110 @@
 """Query preprocessing and enhancement service"""
 
 import re
+import threading
+from collections import OrderedDict
+from itertools import chain
+from operator import attrgetter
 from typing import List, Dict, Tuple, Optional
 
 from backend.app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+PREPROCESS_CACHE_SIZE = 512
+TURN_CONTEXT_CACHE_SIZE = 256
+
+API_SYNONYMS = {
+    "search": ("search", "find", "lookup", "query", "get fare", "check availability"),
+    "block": ("block", "hold", "reserve", "lock"),
+    "booking": ("booking", "book", "reserve", "make reservation"),
+    "cancel": ("cancel", "cancellation", "remove", "delete booking"),
+    "payment": ("payment", "pay", "paid", "transaction", "charge"),
+    "assign": ("assign", "allocate", "attach", "map"),
+    "chauffeur": ("chauffeur", "driver", "cab driver", "vehicle driver"),
+    "tracking": ("tracking", "track", "location", "gps", "position"),
+    "start": ("start", "begin", "initiate", "commence"),
+    "pickup": ("pickup", "boarded", "passenger on board", "customer pickup"),
+    "drop": ("drop", "alight", "dropoff", "destination reached"),
+    "flow": ("flow", "workflow", "process", "sequence", "steps"),
+    "authentication": ("authentication", "auth", "api key", "credentials"),
+    "request": ("request", "payload", "input", "body"),
+    "response": ("response", "output", "result", "return"),
+    "endpoint": ("endpoint", "api", "url", "path"),
+    "parameter": ("parameter", "param", "field", "attribute"),
+}
+
+ENTITY_PATTERNS = {
+    "api_endpoint": r"/\w+(?:/\w+)*",
+    "api_name": r"\b(?:Search|Block|Paid|Cancel|Assign|Reassign|Start|Arrived|Pickup|Alight|Detach|Update|Booking)\b",
+    "http_method": r"\b(?:GET|POST|PUT|DELETE|PATCH)\b",
+    "status_code": r"\b(?:200|201|400|401|403|404|500)\b",
+}
+
+INTENT_KEYWORDS = {
+    "api_usage": ("how to", "how do i", "how can i", "steps to", "way to"),
+    "api_details": ("what is", "explain", "describe", "tell me about", "details of"),
+    "flow": ("flow", "workflow", "process", "sequence", "lifecycle", "journey"),
+    "example": ("example", "sample", "format", "structure", "template"),
+    "troubleshooting": ("error", "issue", "problem", "not working", "fail"),
+    "parameters": ("parameters", "fields", "attributes", "what to send"),
+}
+
+# Leading words of every conversational alternative; a query containing none cannot match
+CONVERSATIONAL_TRIGGERS = frozenset([
+    "hi", "hello", "hey", "greetings", "good", "hola",
+    "thanks", "thank", "thx", "ty", "appreciate", "grateful",
+    "bye", "goodbye", "see", "catch", "later", "take",
+    "ok", "okay", "cool", "sure", "alright", "got", "understand", "makes",
+])
+
+INTENT_EXPANSIONS = {
+    "flow": ("steps", "sequence", "process"),
+    "example": ("request format", "response format", "sample"),
+    "api_usage": ("implementation", "integration"),
+    "parameters": ("fields", "required", "optional"),
+}
+
+
+def unique_head(items, k: int) -> List:
+    """First k distinct items in their original order"""
+    seen = set()
+    head = []
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            head.append(item)
+            if len(head) == k:
+                break
+    return head
+
+
+class KeywordIndex:
+    """Finds every group with a keyword occurring in a text, in a single regex pass"""
+    
+    def __init__(self, groups: Dict[str, Tuple[str, ...]]):
+        keyword_groups: Dict[str, set] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                keyword_groups.setdefault(keyword, set()).add(group)
+        
+        # A matched keyword implies every keyword it contains ("api key" -> "api")
+        self._keyword_groups = {
+            keyword: frozenset().union(*(owners for other, owners in keyword_groups.items() if other in keyword))
+            for keyword in keyword_groups
+        }
+        # Zero-width lookahead so the scan reports the longest keyword starting at every position
+        self._pattern = re.compile(
+            '(?=(' + '|'.join(re.escape(keyword) for keyword in sorted(keyword_groups, key=len, reverse=True)) + '))'
+        )
+    
+    def find_groups(self, text: str) -> set:
+        """Groups with at least one keyword appearing as a substring of text"""
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._keyword_groups[match.group(1)]
+        return found
+
 
 class QueryPreprocessor:
     """Enhance user queries for better retrieval"""
@@ -27,119 +125,161 @@ class QueryPreprocessor:
             ]
         }
         
-        self.api_synonyms = {
-            "search": ["search", "find", "lookup", "query", "get fare", "check availability"],
-            "block": ["block", "hold", "reserve", "lock"],
-            "booking": ["booking", "book", "reserve", "make reservation"],
-            "cancel": ["cancel", "cancellation", "remove", "delete booking"],
-            "payment": ["payment", "pay", "paid", "transaction", "charge"],
-            "assign": ["assign", "allocate", "attach", "map"],
-            "chauffeur": ["chauffeur", "driver", "cab driver", "vehicle driver"],
-            "tracking": ["tracking", "track", "location", "gps", "position"],
-            "start": ["start", "begin", "initiate", "commence"],
-            "pickup": ["pickup", "boarded", "passenger on board", "customer pickup"],
-            "drop": ["drop", "alight", "dropoff", "destination reached"],
-            "flow": ["flow", "workflow", "process", "sequence", "steps"],
-            "authentication": ["authentication", "auth", "api key", "credentials"],
-            "request": ["request", "payload", "input", "body"],
-            "response": ["response", "output", "result", "return"],
-            "endpoint": ["endpoint", "api", "url", "path"],
-            "parameter": ["parameter", "param", "field", "attribute"],
-        }
+        self.api_synonyms = API_SYNONYMS
         
-        self.entity_patterns = {
-            "api_endpoint": r"/\w+(?:/\w+)*",
-            "api_name": r"(?:Search|Block|Paid|Cancel|Assign|Reassign|Start|Arrived|Pickup|Alight|Detach|Update)",
-            "http_method": r"\b(?:GET|POST|PUT|DELETE|PATCH)\b",
-            "status_code": r"\b(?:200|201|400|401|403|404|500)\b",
-        }
+        self.entity_patterns = ENTITY_PATTERNS
         
-        self.intent_keywords = {
-            "api_usage": ["how to", "how do i", "how can i", "steps to", "way to"],
-            "api_details": ["what is", "explain", "describe", "tell me about", "details of"],
-            "flow": ["flow", "workflow", "process", "sequence", "lifecycle", "journey"],
-            "example": ["example", "sample", "format", "structure", "template"],
-            "troubleshooting": ["error", "issue", "problem", "not working", "fail"],
-            "parameters": ["parameters", "fields", "attributes", "what to send"],
+        self.intent_keywords = INTENT_KEYWORDS
+        
+        self.followup_words = frozenset(["and", "also", "that", "it", "this", "elaborate", "example"])
+        self.followup_phrases = [
+            "what about", "how about", "can you explain", "tell me more", "more details", "show me"
+        ]
+        
+        self.topic_patterns = [
+            r'\b(tracking\s+flow)\b',
+            r'\b(booking\s+process)\b',
+            r'\b(payment\s+flow)\b',
+            r'\b(authentication\s+process)\b',
+            r'\b(api\s+integration)\b',
+            r'\b(error\s+handling)\b',
+            r'\b(status\s+updates)\b',
+            r'\b(driver\s+assignment)\b',
+            r'\b(trip\s+lifecycle)\b',
+        ]
+        
+        self.question_patterns = [
+            r'(?:what is|explain|describe|tell me about)\s+(?:the\s+)?([a-z\s]{3,30}?)(?:\?|$|\s+flow|\s+process)',
+            r'(?:how to|how do i)\s+([a-z\s]{3,30}?)(?:\?|$)',
+        ]
+        
+        self.meta_patterns = [
+            r'^(summarize|summarise)\s*(it|that|this)?',
+            r'^(explain|elaborate)\s*(more|further|it|that|this)?',
+            r'^(tell me more|more details|more info)',
+            r'^(give|show|provide)\s*(me\s*)?(an?\s+)?(example|sample)',
+            r'^(what|can you)\s*(do you\s*)?(mean|explain)',
+            r'^(break it down|simplify)',
+            r'^(in other words|to clarify)',
+        ]
+        
+        # One named group per category; category keywords never overlap, so finditer sees every hit
+        self._conversational_re = re.compile('|'.join(
+            f"(?P<{conv_type}>{'|'.join(patterns)})"
+            for conv_type, patterns in self.conversational_patterns.items()
+        ))
+        self._conversational_order = {
+            conv_type: order for order, conv_type in enumerate(self.conversational_patterns)
+        }
+        self._entity_res = {
+            entity_type: re.compile(pattern, re.IGNORECASE)
+            for entity_type, pattern in self.entity_patterns.items()
         }
+        # Word-bounded entities never overlap each other, so they share one pass; endpoints
+        # keep their own scan because an endpoint such as "/search" also contains an API name
+        self._word_entity_re = re.compile(
+            '|'.join(
+                f"(?P<{entity_type}>{pattern})"
+                for entity_type, pattern in self.entity_patterns.items()
+                if entity_type != "api_endpoint"
+            ),
+            re.IGNORECASE
+        )
+        self._intent_index = KeywordIndex(self.intent_keywords)
+        self._synonym_index = KeywordIndex(self.api_synonyms)
+        # Word-bounded, so it agrees with a token lookup while stopping at the first hit
+        self._followup_re = re.compile(
+            r'\b(?:' + '|'.join(
+                re.escape(indicator) for indicator in [*self.followup_phrases, *sorted(self.followup_words)]
+            ) + r')\b'
+        )
+        # Topic phrases never overlap, so one alternation finds the same matches as separate
+        # scans; each pattern has one group, so lastindex says which pattern matched
+        self._topic_re = re.compile('|'.join(self.topic_patterns))
+        self._question_res = [re.compile(pattern) for pattern in self.question_patterns]
+        self._meta_re = re.compile('|'.join(self.meta_patterns))
+        self._word_re = re.compile(r'\w+')
+        self._pronoun_re = re.compile(r'\b(it|this|that|they|them|its)\b')
+        self._meta_pronoun_re = re.compile(r'\b(it|this|that)\b')
+        self._api_name_re = self._entity_res["api_name"]
+        self._endpoint_re = re.compile(r'/\w+')
+        
+        self._preprocess_cache: OrderedDict = OrderedDict()
+        self._turn_context_cache: OrderedDict = OrderedDict()
     
-    def is_conversational(self, query: str) -> Tuple[bool, str]:
+    def is_conversational(self, query: str, query_lower: Optional[str] = None) -> Tuple[bool, str]:
         """Check if query is conversational (greeting, thanks, etc)"""
-        query_lower = query.lower().strip()
+        query_lower = (query_lower or query.lower()).strip()
+        
+        if query_lower.count(' ') > 9:
+            return False, None
         
-        if len(query_lower.split()) > 10:
+        if CONVERSATIONAL_TRIGGERS.isdisjoint(self._word_re.findall(query_lower)):
             return False, None
         
-        for conv_type, patterns in self.conversational_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, query_lower):
-                    return True, conv_type
+        # Earlier categories win when a query mixes them ("thanks, bye" is gratitude)
+        matched_types = {match.lastgroup for match in self._conversational_re.finditer(query_lower)}
+        if matched_types:
+            return True, min(matched_types, key=self._conversational_order.__getitem__)
         
         return False, None
     
-    def detect_intent(self, query: str) -> str:
+    def detect_intent(self, query: str, query_lower: Optional[str] = None) -> str:
         """Detect the intent of the query"""
-        query_lower = query.lower()
+        query_lower = query_lower or query.lower()
         
-        for intent, keywords in self.intent_keywords.items():
-            if any(keyword in query_lower for keyword in keywords):
+        matched_intents = self._intent_index.find_groups(query_lower)
+        for intent in self.intent_keywords:
+            if intent in matched_intents:
                 return intent
         
         return "general"
     
     def extract_entities(self, query: str) -> Dict[str, List[str]]:
         """Extract structured entities from query"""
-        entities = {}
+        found = {entity_type: [] for entity_type in self.entity_patterns}
+        found["api_endpoint"] = self._entity_res["api_endpoint"].findall(query)
         
-        for entity_type, pattern in self.entity_patterns.items():
-            matches = re.findall(pattern, query, re.IGNORECASE)
-            if matches:
-                entities[entity_type] = list(set(matches))
+        for match in self._word_entity_re.finditer(query):
+            found[match.lastgroup].append(match.group())
         
-        return entities
+        return {
+            entity_type: list(dict.fromkeys(matches))
+            for entity_type, matches in found.items()
+            if matches
+        }
     
-    def expand_query(self, query: str, intent: str) -> str:
+    def expand_query(self, query: str, intent: str, query_lower: Optional[str] = None) -> str:
         """Expand query with related terms for better semantic matching"""
-        query_lower = query.lower()
+        query_lower = query_lower or query.lower()
         expanded_terms = []
         
+        matched_terms = self._synonym_index.find_groups(query_lower)
+        
         for term, synonyms in self.api_synonyms.items():
-            if any(syn in query_lower for syn in synonyms):
+            if term in matched_terms:
                 expanded_terms.extend(synonyms[:2])
         
-        if intent == "flow":
-            expanded_terms.extend(["steps", "sequence", "process"])
-        elif intent == "example":
-            expanded_terms.extend(["request format", "response format", "sample"])
-        elif intent == "api_usage":
-            expanded_terms.extend(["implementation", "integration"])
-        elif intent == "parameters":
-            expanded_terms.extend(["fields", "required", "optional"])
+        expanded_terms.extend(INTENT_EXPANSIONS.get(intent, ()))
         
         if expanded_terms:
-            unique_terms = list(set(expanded_terms))[:4]
-            expanded = f"{query} {' '.join(unique_terms)}"
-            return expanded
+            return ' '.join([query, *unique_head(expanded_terms, 4)])
         
         return query
     
     def rewrite_followup_query(
         self, 
         current_query: str, 
-        conversation_history: List[Dict]
+        conversation_history: List[Dict],
+        query_lower: Optional[str] = None
     ) -> str:
         """Rewrite follow-up questions to be self-contained using conversation context"""
-        query_lower = current_query.lower()
-        
-        followup_indicators = [
-            "what about", "how about", "and", "also", "that", "it", "this",
-            "can you explain", "tell me more", "more details", "elaborate",
-            "example", "show me"
-        ]
+        query_lower = query_lower or current_query.lower()
         
-        is_followup = any(indicator in query_lower for indicator in followup_indicators)
-        has_pronoun = bool(re.search(r'\b(it|this|that|they|them|its)\b', query_lower))
-        is_short = len(current_query.split()) < 5
+        # Whole-word checks, so "and" no longer fires inside "command" or "it" inside "with"
+        is_followup = bool(self._followup_re.search(query_lower))
+        has_pronoun = bool(self._pronoun_re.search(query_lower))
+        is_short = current_query.count(' ') < 4
         
         if not (is_followup or has_pronoun or is_short) or not conversation_history:
             return current_query
@@ -151,112 +291,123 @@ class QueryPreprocessor:
         
         for turn in recent_turns:
             if turn["role"] == "user":
-                user_text = turn["content"]
-                
-                api_matches = re.findall(
-                    r'\b(?:Search|Block|Paid|Cancel|Assign|Reassign|Start|Arrived|Pickup|Alight|Detach|Update|Booking)\b',
-                    user_text,
-                    re.IGNORECASE
-                )
-                context_terms.extend(api_matches)
-                
-                endpoint_matches = re.findall(r'/\w+', user_text)
-                context_terms.extend(endpoint_matches)
-                
-                topic_patterns = [
-                    r'\b(tracking\s+flow)\b',
-                    r'\b(booking\s+process)\b',
-                    r'\b(payment\s+flow)\b',
-                    r'\b(authentication\s+process)\b',
-                    r'\b(api\s+integration)\b',
-                    r'\b(error\s+handling)\b',
-                    r'\b(status\s+updates)\b',
-                    r'\b(driver\s+assignment)\b',
-                    r'\b(trip\s+lifecycle)\b',
-                ]
-                
-                for pattern in topic_patterns:
-                    matches = re.findall(pattern, user_text.lower())
-                    context_phrases.extend(matches)
-                
-                question_patterns = [
-                    r'(?:what is|explain|describe|tell me about)\s+(?:the\s+)?([a-z\s]{3,30}?)(?:\?|$|\s+flow|\s+process)',
-                    r'(?:how to|how do i)\s+([a-z\s]{3,30}?)(?:\?|$)',
-                ]
-                
-                for pattern in question_patterns:
-                    matches = re.findall(pattern, user_text.lower())
-                    if matches:
-                        for match in matches:
-                            cleaned = match.strip()
-                            if len(cleaned.split()) <= 5:
-                                context_phrases.append(cleaned)
-        
-        all_context = context_terms + context_phrases
-        
-        if all_context:
-            unique_context = []
-            seen = set()
-            
-            for item in context_phrases:
-                if item and item not in seen:
-                    unique_context.append(item)
-                    seen.add(item)
-            
-            for item in context_terms:
-                if item and item not in seen and len(unique_context) < 4:
-                    unique_context.append(item)
-                    seen.add(item)
-            
-            if unique_context:
-                context_str = ' '.join(unique_context[:3])
-                rewritten = f"{current_query} (context: {context_str})"
-                logger.info(f"Rewrote follow-up query: '{current_query}' -> '{rewritten}'")
-                return rewritten
+                terms, phrases = self._get_turn_context(turn["content"])
+                context_terms.extend(terms)
+                context_phrases.extend(phrases)
+        
+        # Phrases take precedence over bare terms; only the first three distinct items are used
+        unique_context = unique_head(filter(None, chain(context_phrases, context_terms)), 3)
+        
+        if unique_context:
+            context_str = ' '.join(unique_context)
+            rewritten = f"{current_query} (context: {context_str})"
+            logger.info("Rewrote follow-up query: '%s' -> '%s'", current_query, rewritten)
+            return rewritten
         
         return current_query
     
-    def is_meta_query(self, query: str) -> bool:
-        """Detect if query is a meta-query (asking about previous answer)"""
-        query_lower = query.lower().strip()
+    def _get_turn_context(self, user_text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """Context terms and phrases of a user turn, extracted once while the turn stays in recent history"""
+        cached = self._turn_context_cache.get(user_text)
+        if cached is not None:
+            self._turn_context_cache.move_to_end(user_text)
+            return cached
         
-        meta_patterns = [
-            r'^(summarize|summarise)\s*(it|that|this)?',
-            r'^(explain|elaborate)\s*(more|further|it|that|this)?',
-            r'^(tell me more|more details|more info)',
-            r'^(give|show|provide)\s*(me\s*)?(an?\s+)?(example|sample)',
-            r'^(what|can you)\s*(do you\s*)?(mean|explain)',
-            r'^(break it down|simplify)',
-            r'^(in other words|to clarify)',
-        ]
+        user_lower = user_text.lower()
+        
+        context_terms = self._api_name_re.findall(user_text)
+        context_terms.extend(self._endpoint_re.findall(user_text))
         
-        for pattern in meta_patterns:
-            if re.search(pattern, query_lower):
-                return True
+        topic_matches = sorted(self._topic_re.finditer(user_lower), key=attrgetter('lastindex'))
+        context_phrases = [match.group(0) for match in topic_matches]
         
-        if len(query_lower.split()) <= 3:
-            if re.search(r'\b(it|this|that)\b', query_lower):
-                return True
+        for pattern in self._question_res:
+            for match in pattern.findall(user_lower):
+                cleaned = match.strip()
+                if len(cleaned.split()) <= 5:
+                    context_phrases.append(cleaned)
         
-        return False
+        result = (tuple(context_terms), tuple(context_phrases))
+        self._turn_context_cache[user_text] = result
+        if len(self._turn_context_cache) > TURN_CONTEXT_CACHE_SIZE:
+            self._turn_context_cache.popitem(last=False)
+        return result
+    
+    def is_meta_query(self, query: str, query_lower: Optional[str] = None) -> bool:
+        """Detect if query is a meta-query (asking about previous answer)"""
+        query_lower = (query_lower or query.lower()).strip()
+        
+        # Every meta pattern is anchored at the start, so match() avoids retrying at each position
+        if self._meta_re.match(query_lower):
+            return True
+        
+        return query_lower.count(' ') <= 2 and bool(self._meta_pronoun_re.search(query_lower))
     
     def preprocess(
         self,
         query: str,
-        conversation_history: Optional[List[Dict]] = None
+        conversation_history: Optional[List[Dict]] = None,
+        has_cached_context: bool = False
     ) -> Dict[str, any]:
-        """Main preprocessing function"""
-        is_conversational, conv_type = self.is_conversational(query)
-        is_meta = self.is_meta_query(query)
-        intent = self.detect_intent(query)
+        """Main preprocessing function
+
+        When has_cached_context is set, meta-queries skip intent detection, entity
+        extraction, rewriting and expansion, since retrieval will reuse the cached chunks.
+        """
+        # Follow-up rewriting only reads the last three turns, so they fully determine the result
+        history_key = tuple((turn["role"], turn["content"]) for turn in (conversation_history or [])[-3:])
+        cache_key = (query, history_key, has_cached_context)
+        
+        cached = self._preprocess_cache.get(cache_key)
+        if cached is not None:
+            self._preprocess_cache.move_to_end(cache_key)
+            logger.info("Query preprocessing cache hit")
+            return dict(cached)
+        
+        result = self._preprocess(query, conversation_history, has_cached_context)
+        self._preprocess_cache[cache_key] = result
+        if len(self._preprocess_cache) > PREPROCESS_CACHE_SIZE:
+            self._preprocess_cache.popitem(last=False)
+        return dict(result)
+    
+    def _preprocess(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict]],
+        has_cached_context: bool
+    ) -> Dict[str, any]:
+        query_lower = query.lower()
+        
+        is_conversational, conv_type = self.is_conversational(query, query_lower)
+        is_meta = self.is_meta_query(query, query_lower)
+        
+        if is_meta and has_cached_context and not is_conversational:
+            logger.info("Query preprocessing: meta-query answered from cached context")
+            return {
+                "original_query": query,
+                "processed_query": query,
+                "intent": "general",
+                "entities": {},
+                "is_meta_query": True,
+                "is_conversational": False,
+                "conversation_type": None
+            }
+        
+        intent = self.detect_intent(query, query_lower)
         entities = self.extract_entities(query)
         
         if conversation_history:
-            query = self.rewrite_followup_query(query, conversation_history)
+            rewritten = self.rewrite_followup_query(query, conversation_history, query_lower)
+            if rewritten is not query:
+                query = rewritten
+                query_lower = query.lower()
         
-        expanded_query = self.expand_query(query, intent)
+        expanded_query = self.expand_query(query, intent, query_lower)
         
-        logger.info(f"Query preprocessing: intent={intent}, is_meta={is_meta}, is_conversational={is_conversational}, entities={entities}")
+        logger.info(
+            "Query preprocessing: intent=%s, is_meta=%s, is_conversational=%s, entities=%s",
+            intent, is_meta, is_conversational, entities
+        )
         
         return {
             "original_query": query,
@@ -271,10 +422,13 @@ class QueryPreprocessor:
 
 # Global instance
 _query_preprocessor = None
+_query_preprocessor_lock = threading.Lock()
 
 
 def get_query_preprocessor() -> QueryPreprocessor:
     global _query_preprocessor
     if _query_preprocessor is None:
-        _query_preprocessor = QueryPreprocessor()
+        with _query_preprocessor_lock:
+            if _query_preprocessor is None:
+                _query_preprocessor = QueryPreprocessor()
     return _query_preprocessor
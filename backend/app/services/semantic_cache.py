@@ -0,0 +1,227 @@
+"""Exact and semantic caches for LLM responses"""
+
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Normalized embeddings lie in [-1, 1], so int8 scalar quantization maps them onto [-127, 127]
+QUANTIZATION_SCALE = 127.0
+
+
+class SemanticCache:
+    """In-process cache of LLM answers looked up by cosine similarity of query embeddings"""
+
+    def __init__(
+        self,
+        dimension: int = None,
+        max_size: int = None,
+        similarity_threshold: float = None,
+        ttl_seconds: float = None,
+        duplicate_threshold: float = 0.95
+    ):
+        self.dimension = dimension or settings.embedding_dimension
+        self.max_size = max_size or settings.semantic_cache_max_size
+        self.similarity_threshold = similarity_threshold or settings.semantic_cache_threshold
+        self.ttl_seconds = ttl_seconds or settings.semantic_cache_ttl_seconds
+        self.duplicate_threshold = duplicate_threshold
+
+        self._vectors = np.zeros((self.max_size, self.dimension), dtype=np.int8)
+        self.answers: List[Optional[str]] = [None] * self.max_size
+        self.sources: List[List[str]] = [[] for _ in range(self.max_size)]
+        self.scope_keys: List[Optional[str]] = [None] * self.max_size
+        # Slots per scope key, so searches only score answers generated from the same inputs
+        self._scope_slots: Dict[str, set] = {}
+        self.timestamps = np.zeros(self.max_size, dtype=np.float64)
+        self._last_used = np.zeros(self.max_size, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _normalize(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector
+
+    def _quantize(self, vector: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vector * QUANTIZATION_SCALE), -127, 127).astype(np.int8)
+
+    def _search(self, vector: np.ndarray, scope_key: str, now: Optional[float] = None) -> Tuple[int, float]:
+        """Best match among the scope's slots, skipping expired ones when now is given"""
+        slots = self._scope_slots.get(scope_key)
+        if not slots:
+            return -1, 0.0
+
+        candidates = np.fromiter(slots, dtype=np.intp, count=len(slots))
+        if now is not None:
+            candidates = candidates[now - self.timestamps[candidates] <= self.ttl_seconds]
+            if len(candidates) == 0:
+                return -1, 0.0
+
+        scores = (self._vectors[candidates] @ vector) / QUANTIZATION_SCALE
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def lookup(
+        self,
+        embedding,
+        scope_key: str = ""
+    ) -> Optional[Tuple[str, List[str]]]:
+        """Return cached (answer, sources) for a semantically equivalent query with the same scope"""
+        vector = self._normalize(embedding)
+        now = time.time()
+        idx, score = self._search(vector, scope_key, now)
+
+        if idx < 0 or score < self.similarity_threshold:
+            return None
+
+        self._last_used[idx] = now
+        logger.info("Semantic cache hit (similarity=%.3f)", score)
+        return self.answers[idx], list(self.sources[idx])
+
+    def add(
+        self,
+        embedding,
+        answer: str,
+        sources: List[str],
+        scope_key: str = ""
+    ):
+        """Store an answer, updating a near-duplicate entry of the same scope in place when present"""
+        vector = self._normalize(embedding)
+        idx, score = self._search(vector, scope_key)
+        now = time.time()
+
+        if idx < 0 or score <= self.duplicate_threshold:
+            idx = self._allocate_slot(now)
+            previous_key = self.scope_keys[idx]
+            if previous_key is not None:
+                self._scope_slots[previous_key].discard(idx)
+                if not self._scope_slots[previous_key]:
+                    del self._scope_slots[previous_key]
+            self._scope_slots.setdefault(scope_key, set()).add(idx)
+
+        self._vectors[idx] = self._quantize(vector)
+        self.answers[idx] = answer
+        self.sources[idx] = list(sources)
+        self.scope_keys[idx] = scope_key
+        self.timestamps[idx] = now
+        self._last_used[idx] = now
+
+    def _allocate_slot(self, now: float) -> int:
+        if self._size < self.max_size:
+            self._size += 1
+            return self._size - 1
+
+        expired = np.nonzero(now - self.timestamps[:self._size] > self.ttl_seconds)[0]
+        if len(expired) > 0:
+            return int(expired[0])
+
+        return int(np.argmin(self._last_used[:self._size]))
+
+    def clear(self):
+        self._size = 0
+        self.answers = [None] * self.max_size
+        self.sources = [[] for _ in range(self.max_size)]
+        self.scope_keys = [None] * self.max_size
+        self._scope_slots = {}
+        logger.info("Semantic cache cleared")
+
+    def get_stats(self) -> Dict:
+        return {
+            "entries": self._size,
+            "max_size": self.max_size,
+            "similarity_threshold": self.similarity_threshold,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+
+class ResponseCache:
+    """LRU cache of LLM answers for identical (normalized query, memory, context) inputs"""
+
+    def __init__(self, max_size: int = None, ttl_seconds: float = None):
+        self.max_size = max_size or settings.response_cache_max_size
+        self.ttl_seconds = ttl_seconds or settings.response_cache_ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, List[str]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        answer, sources, timestamp = entry
+        if time.time() - timestamp > self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        logger.info("Response cache hit")
+        return answer, list(sources)
+
+    def put(self, key: str, answer: str, sources: List[str]):
+        self._entries[key] = (answer, list(sources), time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        logger.info("Response cache cleared")
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, Unicode compatibility forms and whitespace so trivially different queries share a key"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def make_response_key(query: str, memory: str, context_key: str) -> str:
+    """Digest of the inputs that determine an LLM answer"""
+    payload = f"{normalize_query(query)}||{memory}||{context_key}".encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def make_semantic_scope_key(memory: str, context_key: str) -> str:
+    """Key for the inputs besides the query that a semantic cache hit must share"""
+    memory_digest = hashlib.blake2b(memory.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{memory_digest}||{context_key}"
+
+
+def make_context_key(context: List) -> str:
+    """Identify the retrieved chunk set an answer was generated from"""
+    return "|".join(chunk.id for chunk in context)
+
+
+_semantic_cache = None
+_response_cache = None
+_singleton_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _singleton_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache()
+    return _semantic_cache
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        with _singleton_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
@@ -1,15 +1,64 @@
 """Pinecone vector store integration"""
 
-from typing import List, Dict, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, List, Dict, Optional
+import threading
 import time
 from pinecone import Pinecone, ServerlessSpec
 
 from backend.app.core.config import settings
 from backend.app.utils.logger import setup_logger
-from backend.app.services.embeddings import get_embedding_service
+from backend.app.services.embeddings import get_embedding_batcher, get_embedding_service
 
 logger = setup_logger(__name__)
 
+# Chunk metadata stored alongside each vector, with the default for missing keys
+METADATA_FIELDS = (
+    ("section_title", ""),
+    ("api_endpoint", ""),
+    ("h1", ""),
+    ("h2", ""),
+    ("h3", ""),
+    ("source", ""),
+    ("chunk_index", 0),
+    ("token_count", 0)
+)
+
+
+# Pinecone caps metadata size per vector, so stored chunk text is truncated to this many characters
+MAX_METADATA_TEXT_LENGTH = 40000
+
+# Backoff between checks while waiting on index deletion or creation
+INDEX_POLL_DELAYS = (0.2, 0.4, 0.8, 1.6, 3.2)
+
+
+def wait_until(condition: Callable[[], bool]) -> bool:
+    """Poll condition with increasing delays; returns whether it became true"""
+    for delay in INDEX_POLL_DELAYS:
+        if condition():
+            return True
+        time.sleep(delay)
+    return condition()
+
+
+def project_metadata(metadata: Dict) -> Dict:
+    """Copy the stored metadata fields out of a chunk or match metadata dict"""
+    get = metadata.get
+    return {key: get(key, default) for key, default in METADATA_FIELDS}
+
+
+@dataclass(slots=True)
+class SearchMatch:
+    """Chunk returned by a Pinecone similarity query"""
+    
+    id: str
+    score: float
+    text: str
+    metadata: Dict
+
 
 class VectorStore:
     """Pinecone vector store wrapper"""
@@ -20,44 +69,70 @@ class VectorStore:
         self.index_name = settings.pinecone_index_name
         self.embedding_service = get_embedding_service()
         self._index = None
+        # Reentrant because _get_index bootstraps while already holding it
+        self._index_lock = threading.RLock()
     
     def _get_index(self):
         if self._index is not None:
             return self._index
         
-        existing_indexes = [index.name for index in self.pc.list_indexes()]
-        
-        if self.index_name in existing_indexes:
-            index_info = self.pc.describe_index(self.index_name)
-            existing_dimension = index_info.dimension
+        # Searches run on worker threads, so only the first caller connects; the rest wait and reuse it
+        with self._index_lock:
+            if self._index is not None:
+                return self._index
             
-            if existing_dimension != settings.embedding_dimension:
-                logger.warning(
-                    f"Index dimension mismatch: existing={existing_dimension}, "
-                    f"required={settings.embedding_dimension}. Deleting and recreating index."
-                )
-                self.pc.delete_index(self.index_name)
-                logger.info(f"Deleted existing index: {self.index_name}")
-                time.sleep(2)
-                existing_indexes.remove(self.index_name)
-        
-        if self.index_name not in existing_indexes:
-            logger.info(f"Creating new Pinecone index: {self.index_name}")
-            self.pc.create_index(
-                name=self.index_name,
-                dimension=settings.embedding_dimension,
-                metric="cosine",
-                spec=ServerlessSpec(
-                    cloud="aws",
-                    region="us-east-1"
+            # The index was provisioned by an earlier bootstrap, so skip the existence and dimension probe
+            if settings.pinecone_assume_ready:
+                self._index = self.pc.Index(self.index_name)
+                logger.info(f"Connected to Pinecone index: {self.index_name}")
+                return self._index
+            
+            return self.bootstrap_index()
+    
+    def bootstrap_index(self):
+        """Create or recreate the index if it is missing or has the wrong dimension, then connect"""
+        with self._index_lock:
+            existing_indexes = [index.name for index in self.pc.list_indexes()]
+            
+            if self.index_name in existing_indexes:
+                index_info = self.pc.describe_index(self.index_name)
+                existing_dimension = index_info.dimension
+                
+                if existing_dimension != settings.embedding_dimension:
+                    logger.warning(
+                        f"Index dimension mismatch: existing={existing_dimension}, "
+                        f"required={settings.embedding_dimension}. Deleting and recreating index."
+                    )
+                    self.pc.delete_index(self.index_name)
+                    logger.info(f"Deleted existing index: {self.index_name}")
+                    if not wait_until(self._index_deleted):
+                        logger.warning(f"Index {self.index_name} still listed after deletion")
+                    existing_indexes.remove(self.index_name)
+            
+            if self.index_name not in existing_indexes:
+                logger.info(f"Creating new Pinecone index: {self.index_name}")
+                self.pc.create_index(
+                    name=self.index_name,
+                    dimension=settings.embedding_dimension,
+                    metric="cosine",
+                    spec=ServerlessSpec(
+                        cloud="aws",
+                        region="us-east-1"
+                    )
                 )
-            )
-            logger.info("Waiting for index to be ready...")
-            time.sleep(5)
-        
-        self._index = self.pc.Index(self.index_name)
-        logger.info(f"Connected to Pinecone index: {self.index_name}")
-        return self._index
+                logger.info("Waiting for index to be ready...")
+                if not wait_until(self._index_ready):
+                    logger.warning(f"Index {self.index_name} not reported ready yet")
+            
+            self._index = self.pc.Index(self.index_name)
+            logger.info(f"Connected to Pinecone index: {self.index_name}")
+            return self._index
+    
+    def _index_deleted(self) -> bool:
+        return self.index_name not in [index.name for index in self.pc.list_indexes()]
+    
+    def _index_ready(self) -> bool:
+        return bool(self.pc.describe_index(self.index_name).status['ready'])
     
     def upsert_chunks(
         self,
@@ -70,42 +145,37 @@ class VectorStore:
         logger.info(f"Starting upsert of {len(chunks)} chunks")
         start_time = time.time()
         
-        texts = [chunk['text'] for chunk in chunks]
-        
-        logger.info("Generating embeddings for all chunks")
-        embeddings = self.embedding_service.embed_batch(texts)
+        # Slice batches lazily so only the batches in flight hold vectors
+        chunk_iter = iter(chunks)
+        next_batch = list(islice(chunk_iter, batch_size))
         
-        vectors = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            metadata = chunk['metadata']
-            
-            vector = {
-                "id": metadata['chunk_id'],
-                "values": embedding,
-                "metadata": {
-                    "text": chunk['text'][:40000],
-                    "section_title": metadata.get('section_title', ''),
-                    "api_endpoint": metadata.get('api_endpoint', ''),
-                    "h1": metadata.get('h1', ''),
-                    "h2": metadata.get('h2', ''),
-                    "h3": metadata.get('h3', ''),
-                    "source": metadata.get('source', ''),
-                    "chunk_index": metadata.get('chunk_index', 0),
-                    "token_count": metadata.get('token_count', 0)
-                }
-            }
-            vectors.append(vector)
+        upload_workers = settings.pinecone_upsert_workers
         
         total_upserted = 0
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i + batch_size]
-            try:
-                index.upsert(vectors=batch)
-                total_upserted += len(batch)
-                logger.info(f"Upserted batch {i // batch_size + 1}: {len(batch)} vectors")
-            except Exception as e:
-                logger.error(f"Error upserting batch {i // batch_size + 1}: {str(e)}")
-                raise
+        with ThreadPoolExecutor(max_workers=1) as embed_executor, \
+                ThreadPoolExecutor(max_workers=upload_workers) as upload_executor:
+            # Embed the next batch while earlier ones are uploading
+            pending = embed_executor.submit(self._embed_chunks, next_batch) if next_batch else None
+            uploads = deque()
+            batch_num = 0
+            
+            while next_batch:
+                batch = next_batch
+                batch_num += 1
+                embeddings = pending.result()
+                next_batch = list(islice(chunk_iter, batch_size))
+                if next_batch:
+                    pending = embed_executor.submit(self._embed_chunks, next_batch)
+                
+                vectors = self._build_vectors(batch, embeddings)
+                uploads.append(upload_executor.submit(self._upsert_batch, index, batch_num, vectors))
+                
+                # Cap the backlog so queued vectors stay bounded when uploads are slower than embedding
+                if len(uploads) >= upload_workers * 2:
+                    total_upserted += uploads.popleft().result()
+            
+            while uploads:
+                total_upserted += uploads.popleft().result()
         
         duration = time.time() - start_time
         logger.info(f"Upsert completed: {total_upserted} vectors in {duration:.2f}s")
@@ -115,20 +185,65 @@ class VectorStore:
             "duration_seconds": duration
         }
     
+    def _upsert_batch(self, index, batch_num: int, vectors: List[Dict]) -> int:
+        try:
+            index.upsert(vectors=vectors)
+            logger.info(f"Upserted batch {batch_num}: {len(vectors)} vectors")
+            return len(vectors)
+        except Exception as e:
+            logger.error(f"Error upserting batch {batch_num}: {str(e)}")
+            raise
+    
+    def _embed_chunks(self, chunks: List[Dict]) -> List[List[float]]:
+        return self.embedding_service.embed_batch([chunk['text'] for chunk in chunks])
+    
+    def _build_vectors(self, chunks: List[Dict], embeddings: List[List[float]]) -> List[Dict]:
+        return [
+            {
+                "id": chunk['metadata']['chunk_id'],
+                "values": embedding,
+                "metadata": {
+                    # Slicing a string shorter than the limit returns it without copying
+                    "text": chunk['text'][:MAX_METADATA_TEXT_LENGTH],
+                    **project_metadata(chunk['metadata'])
+                }
+            }
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
+    
+    def embed(self, text: str) -> List[float]:
+        """Embed a query with the same model used for the indexed chunks"""
+        return self.embedding_service.embed_text(text)
+    
+    async def embed_async(self, text: str) -> List[float]:
+        """Embed a query, batched with other concurrent queries off the event loop"""
+        return await get_embedding_batcher().embed(text)
+    
     def semantic_search(
         self,
         query: str,
         top_k: int = None,
         filter_dict: Optional[Dict] = None
-    ) -> List[Dict]:
+    ) -> List[SearchMatch]:
         """Search for similar chunks"""
+        return self.semantic_search_by_vector(
+            self.embed(query),
+            top_k=top_k,
+            filter_dict=filter_dict
+        )
+    
+    def semantic_search_by_vector(
+        self,
+        query_embedding: List[float],
+        top_k: int = None,
+        filter_dict: Optional[Dict] = None
+    ) -> List[SearchMatch]:
+        """Search for chunks similar to a precomputed query embedding"""
         if top_k is None:
             top_k = settings.top_k_results
         
         index = self._get_index()
         
-        query_embedding = self.embedding_service.embed_text(query)
-        
         try:
             results = index.query(
                 vector=query_embedding,
@@ -140,26 +255,20 @@ class VectorStore:
             logger.error(f"Error querying Pinecone: {str(e)}")
             raise
         
+        threshold = settings.similarity_threshold
+        
         matches = []
+        # Pinecone returns matches by descending score, so the first miss ends the useful results
         for match in results.matches:
-            if match.score < settings.similarity_threshold:
-                continue
+            if match.score < threshold:
+                break
             
-            matches.append({
-                "id": match.id,
-                "score": float(match.score),
-                "text": match.metadata.get('text', ''),
-                "metadata": {
-                    "section_title": match.metadata.get('section_title', ''),
-                    "api_endpoint": match.metadata.get('api_endpoint', ''),
-                    "h1": match.metadata.get('h1', ''),
-                    "h2": match.metadata.get('h2', ''),
-                    "h3": match.metadata.get('h3', ''),
-                    "source": match.metadata.get('source', ''),
-                    "chunk_index": match.metadata.get('chunk_index', 0),
-                    "token_count": match.metadata.get('token_count', 0)
-                }
-            })
+            matches.append(SearchMatch(
+                id=match.id,
+                score=float(match.score),
+                text=match.metadata.get('text', ''),
+                metadata=project_metadata(match.metadata)
+            ))
         
         logger.info(
             f"Search completed: {len(matches)} matches above threshold "
@@ -193,10 +302,13 @@ class VectorStore:
 
 
 _vector_store = None
+_vector_store_lock = threading.Lock()
 
 
 def get_vector_store() -> VectorStore:
     global _vector_store
     if _vector_store is None:
-        _vector_store = VectorStore()
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = VectorStore()
     return _vector_store
@@ -1,54 +1,122 @@
 """Logging configuration and utilities"""
 
+import asyncio
+import atexit
 import logging
+import queue
 import sys
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from functools import wraps
-import json
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
+import orjson
 
 from backend.app.core.config import settings
 
+LOG_LEVEL_NAME = settings.log_level.upper()
+LOG_LEVEL = getattr(logging, LOG_LEVEL_NAME, logging.INFO)
+
+# Upper bound on records held back before the console handler writes them out
+LOG_FLUSH_RECORDS = 50
+
+# Attributes every LogRecord carries, plus the ones formatters add while rendering
+STANDARD_RECORD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", (), None).__dict__
+) | {"message", "asctime"}
+
 
 class StructuredFormatter(logging.Formatter):
     """Custom formatter for structured JSON logging"""
     
+    def __init__(self):
+        super().__init__()
+        # Handlers call format() under their lock, so this cache is never shared across threads
+        self._last_second = None
+        self._last_prefix = ""
+    
+    def _timestamp(self, created: float) -> str:
+        """ISO 8601 UTC timestamp, re-rendering the date and time only when the second changes"""
+        second = int(created)
+        if second != self._last_second:
+            self._last_prefix = datetime.utcfromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S")
+            self._last_second = second
+        return f"{self._last_prefix}.{int((created - second) * 1e6):06d}"
+    
     def format(self, record: logging.LogRecord) -> str:
         log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
         }
         
-        # Add extra fields if present
-        if hasattr(record, "extra"):
-            log_data.update(record.extra)
+        # logging merges extra= into the record's attributes, so anything non-standard is an extra field
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_RECORD_ATTRS:
+                log_data[key] = value
         
         # Add exception info if present
         if record.exc_info:
             log_data["exception"] = self.formatException(record.exc_info)
         
-        return json.dumps(log_data)
+        return orjson.dumps(log_data, default=str).decode("utf-8")
 
 
-def setup_logger(name: str) -> logging.Logger:
-    """Set up a logger with structured formatting"""
-    logger = logging.getLogger(name)
+# Records waiting for the background writer thread
+_log_queue = queue.SimpleQueue()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that resolves the message in the caller but leaves formatting to the listener"""
     
-    # Avoid adding handlers multiple times
-    if logger.handlers:
-        return logger
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records stay in-process, so exc_info and extras can travel with the record as-is
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """Stream handler that collects formatted records and writes each batch with one call"""
+    
+    def __init__(self, stream, pending: queue.SimpleQueue, max_buffered: int = LOG_FLUSH_RECORDS):
+        super().__init__(stream)
+        self._pending = pending
+        self._max_buffered = max_buffered
+        self._buffer: List[str] = []
     
-    logger.setLevel(getattr(logging, settings.log_level.upper()))
+    def emit(self, record: logging.LogRecord):
+        # Errors are reported rather than raised, since raising would stop the listener thread
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+            
+            # Write once the listener has drained its backlog, or sooner if the buffer fills up
+            if len(self._buffer) >= self._max_buffered or self._pending.empty():
+                self.flush()
+        except Exception:
+            self.handleError(record)
     
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(getattr(logging, settings.log_level.upper()))
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer:
+                # Cleared before writing so a failed write drops the batch instead of retrying it forever
+                batch = "".join(self._buffer)
+                self._buffer.clear()
+                self.stream.write(batch)
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+def _build_console_handler() -> logging.Handler:
+    console_handler = BufferedStreamHandler(sys.stdout, _log_queue)
+    console_handler.setLevel(LOG_LEVEL)
     
     # Use simple format for development, structured for production
-    if settings.log_level.upper() == "DEBUG":
+    if LOG_LEVEL_NAME == "DEBUG":
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
@@ -56,74 +124,99 @@ def setup_logger(name: str) -> logging.Logger:
         formatter = StructuredFormatter()
     
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    return console_handler
+
+
+# Loggers only enqueue records; one background thread formats them and writes to stdout
+_queue_handler = DeferredQueueHandler(_log_queue)
+_queue_listener = QueueListener(_log_queue, _build_console_handler(), respect_handler_level=True)
+_queue_listener.start()
+atexit.register(_queue_listener.stop)
+
+
+def _skip_find_caller(*args, **kwargs):
+    """Stand-in for Logger.findCaller; neither formatter renders the caller's file, line or function"""
+    return "(unknown file)", 0, "(unknown function)", None
+
+
+def setup_logger(name: str) -> logging.Logger:
+    """Set up a logger with structured formatting"""
+    logger = logging.getLogger(name)
+    
+    # Avoid adding handlers multiple times
+    if logger.handlers:
+        return logger
+    
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(_queue_handler)
+    # Every application logger has the shared handler, so propagating would emit child records twice
+    logger.propagate = False
+    # Saves a stack walk on every log call
+    logger.findCaller = _skip_find_caller
     
     return logger
 
 
+def _elapsed_ms(start_ns: int) -> float:
+    """Milliseconds since a perf_counter_ns() reading, rounded to two decimals with integer math"""
+    return (time.perf_counter_ns() - start_ns + 5_000) // 10_000 / 100
+
+
+def _log_success(logger: logging.Logger, name: str, start_ns: int):
+    """Emit the record for a timed call that returned"""
+    logger.info(
+        f"{name} executed",
+        extra={
+            "function": name,
+            "execution_time_ms": _elapsed_ms(start_ns),
+            "status": "success"
+        }
+    )
+
+
+def _log_failure(logger: logging.Logger, name: str, start_ns: Optional[int], error: Exception):
+    """Emit the record for a timed call that raised; start_ns is None when timing was skipped"""
+    extra: Dict[str, Any] = {"function": name}
+    if start_ns is not None:
+        extra["execution_time_ms"] = _elapsed_ms(start_ns)
+    extra["status"] = "error"
+    extra["error"] = str(error)
+    logger.error(f"{name} failed", extra=extra)
+
+
 def log_execution_time(logger: logging.Logger):
     """Decorator to log function execution time"""
     def decorator(func):
-        @wraps(func)
-        async def async_wrapper(*args, **kwargs):
-            start_time = time.time()
-            try:
-                result = await func(*args, **kwargs)
-                execution_time = (time.time() - start_time) * 1000  # ms
-                logger.info(
-                    f"{func.__name__} executed",
-                    extra={
-                        "function": func.__name__,
-                        "execution_time_ms": round(execution_time, 2),
-                        "status": "success"
-                    }
-                )
+        name = func.__name__
+        
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                # Skip timing entirely when the success record would be dropped anyway
+                start_ns = time.perf_counter_ns() if logger.isEnabledFor(logging.INFO) else None
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    _log_failure(logger, name, start_ns, e)
+                    raise
+                if start_ns is not None:
+                    _log_success(logger, name, start_ns)
                 return result
-            except Exception as e:
-                execution_time = (time.time() - start_time) * 1000  # ms
-                logger.error(
-                    f"{func.__name__} failed",
-                    extra={
-                        "function": func.__name__,
-                        "execution_time_ms": round(execution_time, 2),
-                        "status": "error",
-                        "error": str(e)
-                    }
-                )
-                raise
+            
+            return async_wrapper
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_ns = time.perf_counter_ns() if logger.isEnabledFor(logging.INFO) else None
             try:
                 result = func(*args, **kwargs)
-                execution_time = (time.time() - start_time) * 1000  # ms
-                logger.info(
-                    f"{func.__name__} executed",
-                    extra={
-                        "function": func.__name__,
-                        "execution_time_ms": round(execution_time, 2),
-                        "status": "success"
-                    }
-                )
-                return result
             except Exception as e:
-                execution_time = (time.time() - start_time) * 1000  # ms
-                logger.error(
-                    f"{func.__name__} failed",
-                    extra={
-                        "function": func.__name__,
-                        "execution_time_ms": round(execution_time, 2),
-                        "status": "error",
-                        "error": str(e)
-                    }
-                )
+                _log_failure(logger, name, start_ns, e)
                 raise
+            if start_ns is not None:
+                _log_success(logger, name, start_ns)
+            return result
         
-        # Return appropriate wrapper based on function type
-        import asyncio
-        if asyncio.iscoroutinefunction(func):
-            return async_wrapper
         return sync_wrapper
     
     return decorator
@@ -139,6 +232,9 @@ def log_query_metrics(
     confidence: str
 ):
     """Log metrics for a query"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     logger.info(
         "Query processed",
         extra={
@@ -161,6 +257,9 @@ def log_ingestion_metrics(
     error: Optional[str] = None
 ):
     """Log metrics for document ingestion"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     logger.info(
         "Document ingestion completed",
         extra={